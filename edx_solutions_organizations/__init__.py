@@ -0,0 +1 @@
+default_app_config = 'edx_solutions_organizations.apps.OrganizationsConfig'
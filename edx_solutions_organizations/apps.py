@@ -0,0 +1,16 @@
+"""
+App configuration for edx_solutions_organizations
+"""
+from django.apps import AppConfig
+
+
+class OrganizationsConfig(AppConfig):
+    """
+    Application configuration for the organizations app
+    """
+    name = 'edx_solutions_organizations'
+    verbose_name = 'Organizations'
+
+    def ready(self):
+        # Connect signal receivers
+        from edx_solutions_organizations import receivers  # pylint: disable=unused-variable
@@ -0,0 +1,309 @@
+"""
+Caching helpers for organization data
+"""
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import six
+
+from edx_solutions_organizations.utils import AttributeSchema
+
+
+class LRUCache(object):
+    """
+    Thread-safe, process-local least-recently-used cache with an optional
+    per-entry timeout. Keeps hit and miss counters for monitoring.
+    """
+
+    def __init__(self, max_size, timeout=None):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Returns the value stored against key, or default if it is missing or expired
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or (entry[0] is not None and entry[0] < time.time()):
+                self.misses += 1
+                return default
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """
+        Stores value against key, evicting the least recently used entry when full
+        """
+        expires_at = time.time() + self.timeout if self.timeout else None
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (expires_at, value)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Removes key from the cache if present
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Removes all entries and resets the counters
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Returns hit, miss and size counters
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+
+class OrganizationAttributeSchemaCache(object):
+    """
+    Cross-request cache of organization attribute schemas.
+
+    Schemas are kept in a process-local LRU keyed by organization id and the
+    organization `modified` timestamp. The current `modified` value of each
+    organization is stamped into a shared django cache backend so that a
+    lookup does not need the database when the stamp and the local entry
+    agree. Without a shared backend the stamp is read from the database.
+    """
+    VERSION_KEY = 'edx_solutions_organizations.attributes_version.{}'
+
+    def __init__(self):
+        self._local = LRUCache(getattr(settings, 'ORGANIZATION_ATTRIBUTES_CACHE_SIZE', 1000))
+
+    @staticmethod
+    def _get_shared_cache():
+        alias = getattr(settings, 'ORGANIZATION_ATTRIBUTES_CACHE_BACKEND', 'default')
+        return caches[alias] if alias else None
+
+    def get(self, organization_id):
+        """
+        Returns the attribute schema of the given organization, or None if it does not exist
+        """
+        from edx_solutions_organizations.models import Organization, OrganizationAttribute
+
+        organization_id = int(organization_id)
+        shared_cache = self._get_shared_cache()
+        version = shared_cache.get(self.VERSION_KEY.format(organization_id)) if shared_cache else None
+        if version is None:
+            version = Organization.objects.filter(id=organization_id).values_list('modified', flat=True).first()
+            if version is None:
+                return None
+            if shared_cache:
+                # add rather than set, a version stamped by a committed write must not be replaced
+                shared_cache.add(
+                    self.VERSION_KEY.format(organization_id),
+                    version,
+                    getattr(settings, 'ORGANIZATION_ATTRIBUTES_CACHE_TIMEOUT', 300)
+                )
+
+        schema = self._local.get((organization_id, version))
+        if schema is None:
+            schema = OrganizationAttribute.get_schema(organization_id)
+            self._local.set((organization_id, version), schema)
+        return schema
+
+    def get_for_instance(self, organization):
+        """
+        Returns the attribute schema of an already loaded organization instance
+        """
+        from edx_solutions_organizations.models import OrganizationAttribute
+
+        if organization.pk is None:
+            return AttributeSchema([])
+
+        key = (organization.pk, organization.modified)
+        schema = self._local.get(key)
+        if schema is None:
+            schema = OrganizationAttribute.get_schema(organization.pk)
+            self._local.set(key, schema)
+        return schema
+
+    def invalidate(self, organization_id, version=None):
+        """
+        Stamps the given version of an organization, or drops its stamp when no
+        version is given, so the next lookup does not serve an older schema.
+        Must be called once the write has been committed.
+        """
+        shared_cache = self._get_shared_cache()
+        if not shared_cache:
+            return
+        if version is None:
+            shared_cache.delete(self.VERSION_KEY.format(organization_id))
+        else:
+            shared_cache.set(
+                self.VERSION_KEY.format(organization_id),
+                version,
+                getattr(settings, 'ORGANIZATION_ATTRIBUTES_CACHE_TIMEOUT', 300)
+            )
+
+    def clear(self):
+        """
+        Removes all process-local entries and resets the counters
+        """
+        self._local.clear()
+
+    def stats(self):
+        """
+        Returns hit, miss and size counters of the process-local cache
+        """
+        return self._local.stats()
+
+
+class OrganizationMetricsCache(object):
+    """
+    Cache of organization metrics keyed by organization and course filter.
+
+    Every key includes a generation stamp of the organization, stored in the
+    same django cache backend. Invalidating an organization drops its stamp so
+    that all metrics cached under the previous generation are no longer looked
+    up and simply expire after ORGANIZATION_METRICS_CACHE_TIMEOUT seconds.
+    """
+    GENERATION_KEY = 'edx_solutions_organizations.metrics_generation.{}'
+    METRICS_KEY = 'edx_solutions_organizations.metrics.{}.{}.{}'
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _get_cache():
+        return caches[getattr(settings, 'ORGANIZATION_METRICS_CACHE_BACKEND', 'default')]
+
+    def get_key(self, organization_id, course_keys):
+        """
+        Returns the cache key of the organization and courses under the current
+        generation. Metrics computed after a miss must be stored with set() under
+        the key of the lookup, so that a result computed before an invalidation is
+        stored under the dropped generation and never served.
+        """
+        cache = self._get_cache()
+        generation_key = self.GENERATION_KEY.format(organization_id)
+        generation = cache.get(generation_key)
+        if generation is None:
+            cache.add(generation_key, uuid.uuid4().hex, None)
+            generation = cache.get(generation_key)
+        # course filters are normalized so the order and repetition of courses do not matter
+        courses = u','.join(sorted(set(six.text_type(course_key) for course_key in course_keys)))
+        return self.METRICS_KEY.format(
+            organization_id, generation, hashlib.md5(courses.encode('utf-8')).hexdigest()
+        )
+
+    def get(self, key):
+        """
+        Returns the metrics cached under a key returned by get_key(), or None
+        """
+        metrics = self._get_cache().get(key)
+        with self._lock:
+            if metrics is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return metrics
+
+    def set(self, key, metrics):
+        """
+        Caches metrics under a key returned by get_key()
+        """
+        self._get_cache().set(key, metrics, getattr(settings, 'ORGANIZATION_METRICS_CACHE_TIMEOUT', 300))
+
+    def invalidate(self, organization_id):
+        """
+        Drops the generation stamp of an organization so its metrics are recomputed
+        """
+        self._get_cache().delete(self.GENERATION_KEY.format(organization_id))
+
+    def reset_stats(self):
+        """
+        Resets the hit and miss counters
+        """
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Returns hit and miss counters of this process
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+class CourseOverviewCache(object):
+    """
+    Process-local cache of CourseOverview objects keyed by course key. Entries
+    are dropped when a course is published or deleted, or its overview is
+    written in this process, and expire after ORGANIZATION_COURSE_OVERVIEW_CACHE_TIMEOUT
+    seconds so that changes made in other processes are picked up.
+    """
+
+    def __init__(self):
+        self._local = LRUCache(
+            getattr(settings, 'ORGANIZATION_COURSE_OVERVIEW_CACHE_SIZE', 1000),
+            getattr(settings, 'ORGANIZATION_COURSE_OVERVIEW_CACHE_TIMEOUT', 300)
+        )
+
+    def get_many(self, course_keys):
+        """
+        Returns a dict of {course_key: CourseOverview} for the given keys which have
+        an overview. Overviews missing from the cache are read with a single query.
+        """
+        from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
+
+        overviews = {}
+        missing_keys = []
+        for course_key in course_keys:
+            overview = self._local.get(course_key)
+            if overview is None:
+                missing_keys.append(course_key)
+            else:
+                overviews[course_key] = overview
+        if missing_keys:
+            for overview in CourseOverview.objects.filter(id__in=missing_keys):
+                self._local.set(overview.id, overview)
+                overviews[overview.id] = overview
+        return overviews
+
+    def invalidate(self, course_key):
+        """
+        Drops the cached overview of a course
+        """
+        self._local.delete(course_key)
+
+    def clear(self):
+        """
+        Removes all process-local entries and resets the counters
+        """
+        self._local.clear()
+
+    def stats(self):
+        """
+        Returns hit, miss and size counters of the process-local cache
+        """
+        return self._local.stats()
+
+
+attribute_schema_cache = OrganizationAttributeSchemaCache()  # pylint: disable=invalid-name
+course_overview_cache = CourseOverviewCache()  # pylint: disable=invalid-name
+metrics_cache = OrganizationMetricsCache()  # pylint: disable=invalid-name
@@ -0,0 +1,491 @@
+"""
+Management command to time organizations queries and endpoints against their previous implementation
+"""
+import logging
+import time
+import uuid
+from functools import reduce
+
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, Prefetch, Q, When
+from opaque_keys.edx.keys import CourseKey
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from edx_solutions_api_integration.courses.serializers import OrganizationCourseSerializer
+from edx_solutions_api_integration.courseware_access import get_course_key
+from edx_solutions_api_integration.models import GroupProfile
+from edx_solutions_api_integration.users.serializers import SimpleUserSerializer
+from edx_solutions_api_integration.utils import str2bool
+from gradebook.models import StudentGradebook
+from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
+from student.models import CourseAccessRole, CourseEnrollment
+from student.roles import CourseStaffRole
+
+from edx_solutions_organizations.models import Organization, OrganizationAttribute, OrganizationUsersAttributes
+from edx_solutions_organizations.serializers import OrganizationWithCourseCountSerializer
+from edx_solutions_organizations.utils import COURSE_ADMIN_ROLES, chunks
+from edx_solutions_organizations.views import OrganizationsViewSet
+
+log = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+class _Rollback(Exception):
+    """
+    Raised to roll back the benchmark fixture
+    """
+    pass
+
+
+def _time(func, repeat):
+    """
+    Returns the fastest and the median duration of func in milliseconds
+    """
+    durations = []
+    for __ in range(repeat):
+        start = time.time()
+        func()
+        durations.append((time.time() - start) * 1000)
+    durations.sort()
+    return durations[0], durations[len(durations) // 2]
+
+
+def _evaluate(result):
+    """
+    Fetches the rows of a queryset, other results are returned as they are
+    """
+    return list(result) if hasattr(result, 'query') else result
+
+
+def _explain(queryset):
+    """
+    Returns the query plan rows of a queryset
+    """
+    sql, params = queryset.query.sql_with_params()
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        return cursor.fetchall()
+
+
+def _chained_attribute_filter(users, organizations, attribute_keys, attribute_values):
+    """
+    Previous implementation of Organization.get_all_users_by_organization_attribute_filter,
+    joining the attribute values once per attribute
+    """
+    attribute_active_keys = set(OrganizationAttribute.objects.filter(
+        organization__in=organizations, is_active=True
+    ).values_list('key', flat=True))
+    for i, attribute_key in enumerate(attribute_keys):
+        if attribute_key in attribute_active_keys:
+            users = users.filter(
+                user_attributes__key=attribute_key,
+                user_attributes__value=attribute_values[i],
+                user_attributes__organization_id__in=organizations,
+            ).all()
+    return users
+
+
+class _PreviousOrganizationsViewSet(OrganizationsViewSet):
+    """
+    Previous implementations of the list, users and courses endpoints
+    """
+
+    def list(self, request, *args, **kwargs):
+        """
+        Counts courses and participants over the users x enrollments join, with one
+        query per company admin when the type parameter is given
+        """
+        self.serializer_class = OrganizationWithCourseCountSerializer
+        queryset = self.get_queryset()
+        exclude_type = request.query_params.get('type', None)
+        if exclude_type:
+            q_object = Q()
+            user_ids = CourseAccessRole.objects.filter(role__in=COURSE_ADMIN_ROLES).distinct()\
+                .values_list('user_id', flat=True)
+            q_object.add(~Q(users__courseenrollment__user_id__in=user_ids), Q.AND)
+
+            admin_users = User.objects.filter(id__in=list(queryset.filter(
+                Q(users__groups__groupprofile__name=exclude_type)
+            ).distinct().values_list('users', flat=True)))
+            admin_users_dict = {}
+            for user in admin_users:
+                for company in list(user.organizations.all())[1:]:
+                    admin_users_dict.setdefault(company.id, []).append(user.id)
+            exclude_admin_users = [
+                Q(id=org_id) & Q(users__courseenrollment__user_id__in=users)
+                for org_id, users in admin_users_dict.items()
+            ]
+            if exclude_admin_users:
+                q_object.add(~Q(reduce(lambda a, b: a | b, exclude_admin_users)), Q.AND)
+
+            queryset = queryset.annotate(number_of_courses=Count(
+                Case(When(q_object, then=F('users__courseenrollment__course_id'))), distinct=True
+            ))
+        else:
+            queryset = queryset.annotate(number_of_courses=Count('users__courseenrollment__course_id', distinct=True))
+        self.queryset = queryset.annotate(number_of_participants=Count('users', distinct=True))
+        return super(OrganizationsViewSet, self).list(request, *args, **kwargs)
+
+    def users(self, request, pk):
+        """
+        Serializes users one at a time and parses the flags for every user
+        """
+        include_course_counts = request.query_params.get('include_course_counts', None)
+        include_grades = request.query_params.get('include_grades', None)
+        include_attributes = request.query_params.get('include_attributes', None)
+        course_id = request.query_params.get('course_id', None)
+        grade_complete_match_range = getattr(settings, 'GRADEBOOK_GRADE_COMPLETE_PROFORMA_MATCH_RANGE', 0.01)
+        course_key = get_course_key(course_id) if course_id else None
+
+        users = User.objects.filter(organizations=pk)
+        if course_key:
+            users = users.filter(courseenrollment__course_id__exact=course_key, courseenrollment__is_active=True)
+            if str2bool(include_grades):
+                users = users.prefetch_related(
+                    Prefetch('studentgradebook_set', queryset=StudentGradebook.objects.filter(course_id=course_key))
+                )
+        if str2bool(include_attributes):
+            users = users.prefetch_related(Prefetch(
+                'user_attributes',
+                queryset=OrganizationUsersAttributes.objects.filter(
+                    organization=pk, key__in=Organization.objects.get(id=pk).get_all_attribute_keys()
+                ),
+                to_attr='organization_attributes'
+            ))
+        if str2bool(include_course_counts):
+            enrollments = CourseEnrollment.objects.filter(user__in=users).values('user').order_by()\
+                .annotate(total=Count('user'))
+            enrollments_by_user = {enrollment['user']: enrollment['total'] for enrollment in enrollments}
+
+        response_data = []
+        if users:
+            for user in users:
+                user_data = SimpleUserSerializer(user).data
+                if str2bool(include_course_counts):
+                    user_data['course_count'] = enrollments_by_user.get(user.id, 0)
+                if str2bool(include_grades) and course_key:
+                    user_grades = {'grade': 0, 'proforma_grade': 0, 'complete_status': False}
+                    gradebook = user.studentgradebook_set.all()
+                    if gradebook:
+                        user_grades['grade'] = gradebook[0].grade
+                        user_grades['proforma_grade'] = gradebook[0].proforma_grade
+                        user_grades['complete_status'] = True if 0 < gradebook[0].proforma_grade <= \
+                            gradebook[0].grade + grade_complete_match_range else False
+                    user_data.update(user_grades)
+                if str2bool(include_attributes):
+                    user_data['organization_attributes'] = {
+                        attribute.key: attribute.value for attribute in user.organization_attributes
+                    }
+                response_data.append(user_data)
+        return Response(response_data, status=status.HTTP_200_OK)
+
+    def courses(self, request, pk):
+        """
+        Groups enrollments with list membership tests and parses every course key back from a string
+        """
+        exclude_admins = str2bool(request.query_params.get('exclude_admins'))
+        organization = self.get_object()
+        organization_courses = []
+        organization_course_ids = []
+        roles_to_exclude = []
+        if exclude_admins:
+            organization_courses = CourseEnrollment.objects\
+                .filter(user__organizations=organization, is_active=True)\
+                .order_by('course_id').distinct().values_list('course_id', flat=True)
+            for course_id in organization_courses:
+                organization_course_ids.append(course_id.to_deprecated_string())
+            organization_courses = map(get_course_key, filter(None, organization_course_ids))
+            roles_to_exclude = COURSE_ADMIN_ROLES
+
+        enrollment_qs = CourseEnrollment.objects\
+            .filter(user__organizations=organization, is_active=True)\
+            .exclude(
+                user_id__in=CourseAccessRole.objects.filter(
+                    course_id__in=organization_courses, role__in=roles_to_exclude
+                ).values_list('user_id', flat=True)
+            ).values_list('course_id', 'user_id')
+
+        enrollments = {}
+        course_ids = []
+        for (course_id, user_id) in enrollment_qs:
+            enrollments.setdefault(course_id.to_deprecated_string(), []).append(user_id)
+            if course_id.to_deprecated_string() not in course_ids:
+                course_ids.append(course_id.to_deprecated_string())
+
+        course_keys = map(get_course_key, filter(None, course_ids))
+        courses = CourseOverview.objects.filter(id__in=course_keys)
+        serializer = OrganizationCourseSerializer(
+            courses, many=True, context={'request': request, 'enrollments': enrollments}
+        )
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+def _call_view(viewset, action, requester, params=None, **kwargs):
+    """
+    Calls an action of the viewset and returns the rendered response content
+    """
+    headers = {}
+    if getattr(settings, 'EDX_API_KEY', None):
+        headers['HTTP_X_EDX_API_KEY'] = settings.EDX_API_KEY
+    request = APIRequestFactory().get('/api/server/organizations/', params or {}, **headers)
+    force_authenticate(request, user=requester)
+    response = viewset.as_view({'get': action})(request, **kwargs)
+    if response.status_code != status.HTTP_200_OK:
+        raise CommandError('{} responded with {}'.format(action, response.status_code))
+    if response.streaming:
+        return b''.join(response.streaming_content)
+    return response.render().content
+
+
+class Command(BaseCommand):
+    """
+    Creates a synthetic fixture, times each scenario with its previous and current
+    implementation and rolls the fixture back. Endpoints are called through their
+    viewset, so serialization is included in their timings.
+    """
+    help = 'Times organizations queries and endpoints on a synthetic fixture, nothing is kept in the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organizations', type=int, default=10, help='Number of organizations to create.')
+        parser.add_argument('--users', type=int, default=10000, help='Number of users spread over the organizations.')
+        parser.add_argument('--attributes', type=int, default=5, help='Number of attributes filtered on.')
+        parser.add_argument('--courses', type=int, default=20, help='Number of courses users are enrolled in.')
+        parser.add_argument('--enrollments', type=int, default=3, help='Number of enrollments per user.')
+        parser.add_argument('--admins', type=int, default=100, help='Number of company admins with a course role.')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of timed runs of each implementation.')
+        parser.add_argument('--explain', action='store_true', help='Print the query plans of both implementations.')
+
+    def handle(self, *args, **options):
+        if options['admins'] > options['users']:
+            raise CommandError('--admins must not be greater than --users.')
+        try:
+            with transaction.atomic():
+                fixture = self._create_fixture(options)
+                for name, previous, current in self._get_scenarios(fixture):
+                    self._run_scenario(name, previous, current, options)
+                raise _Rollback()
+        except _Rollback:
+            log.info('benchmark fixture rolled back')
+
+    def _create_fixture(self, options):
+        """
+        Creates organizations, their members, attribute values, enrollments and company admins
+        with bulk inserts, signals are not sent
+        """
+        prefix = uuid.uuid4().hex[:8]
+        log.info('creating benchmark fixture %s', prefix)
+        Organization.objects.bulk_create([
+            Organization(name='benchmark {} {}'.format(prefix, index)) for index in range(options['organizations'])
+        ])
+        organization_ids = list(
+            Organization.objects.filter(name__startswith='benchmark {} '.format(prefix)).order_by('id')
+            .values_list('id', flat=True)
+        )
+
+        for chunk in chunks(range(options['users']), BATCH_SIZE):
+            User.objects.bulk_create([
+                User(username='benchmark_{}_{}'.format(prefix, index), email='benchmark_{}_{}@example.com'.format(
+                    prefix, index
+                )) for index in chunk
+            ])
+        user_ids = list(
+            User.objects.filter(username__startswith='benchmark_{}_'.format(prefix)).order_by('id')
+            .values_list('id', flat=True)
+        )
+
+        memberships = [
+            Organization.users.through(organization_id=organization_ids[index % len(organization_ids)], user_id=user_id)
+            for index, user_id in enumerate(user_ids)
+        ]
+        for chunk in chunks(memberships, BATCH_SIZE):
+            Organization.users.through.objects.bulk_create(chunk)
+
+        # every user gets a value for each attribute of their organization, values repeat every 10 users
+        attribute_keys = ['benchmark_{}'.format(order) for order in range(1, options['attributes'] + 1)]
+        OrganizationAttribute.objects.bulk_create([
+            OrganizationAttribute(organization_id=organization_id, key=key, label=key, order=order)
+            for organization_id in organization_ids for order, key in enumerate(attribute_keys, 1)
+        ])
+        values = [
+            OrganizationUsersAttributes(
+                organization_id=membership.organization_id, user_id=membership.user_id, key=key,
+                value=str((membership.user_id + order) % 10)
+            )
+            for membership in memberships for order, key in enumerate(attribute_keys)
+        ]
+        for chunk in chunks(values, BATCH_SIZE):
+            OrganizationUsersAttributes.objects.bulk_create(chunk)
+
+        course_keys = [
+            CourseKey.from_string('course-v1:Benchmark+C{}+{}'.format(index, prefix))
+            for index in range(options['courses'])
+        ]
+        enrollments_per_user = min(options['enrollments'], len(course_keys))
+        enrollments = [
+            CourseEnrollment(
+                user_id=user_id, course_id=course_keys[(index + offset) % len(course_keys)], is_active=True
+            )
+            for index, user_id in enumerate(user_ids) for offset in range(enrollments_per_user)
+        ]
+        for chunk in chunks(enrollments, BATCH_SIZE):
+            CourseEnrollment.objects.bulk_create(chunk)
+
+        # users enrolled in the first course have a grade in it
+        gradebooks = [
+            StudentGradebook(
+                user_id=enrollment.user_id, course_id=enrollment.course_id, grade=0.5, proforma_grade=0.5
+            )
+            for enrollment in enrollments if enrollment.course_id == course_keys[0]
+        ]
+        for chunk in chunks(gradebooks, BATCH_SIZE):
+            StudentGradebook.objects.bulk_create(chunk)
+
+        # company admins belong to a second organization and hold a role in one of their courses
+        admin_type = 'benchmark_admin_{}'.format(prefix)
+        group = Group.objects.create(name=admin_type)
+        GroupProfile.objects.create(group=group, group_type='permission', name=admin_type)
+        admin_ids = user_ids[:options['admins']]
+        User.groups.through.objects.bulk_create([
+            User.groups.through(user_id=user_id, group_id=group.id) for user_id in admin_ids
+        ])
+        if len(organization_ids) > 1:
+            Organization.users.through.objects.bulk_create([
+                Organization.users.through(
+                    organization_id=organization_ids[(index + 1) % len(organization_ids)], user_id=user_id
+                ) for index, user_id in enumerate(admin_ids)
+            ])
+        CourseAccessRole.objects.bulk_create([
+            CourseAccessRole(
+                user_id=user_id, course_id=course_keys[index % len(course_keys)], org='Benchmark',
+                role=CourseStaffRole.ROLE
+            ) for index, user_id in enumerate(admin_ids)
+        ])
+
+        requester = User.objects.create(username='benchmark_{}_staff'.format(prefix), is_staff=True, is_superuser=True)
+
+        return {
+            'organization_ids': organization_ids,
+            'user_ids': user_ids,
+            'attribute_keys': attribute_keys,
+            'course_keys': course_keys,
+            'admin_type': admin_type,
+            'requester': requester,
+        }
+
+    def _get_scenarios(self, fixture):
+        """
+        Returns (name, previous, current) tuples, each implementation is a callable returning
+        a queryset, which is evaluated when timed and explained, or the content of a response
+        """
+        organization = Organization.objects.get(id=fixture['organization_ids'][0])
+        requester = fixture['requester']
+        first_user_id = fixture['user_ids'][0]
+        attribute_keys = fixture['attribute_keys']
+        attribute_values = [str((first_user_id + order) % 10) for order in range(len(attribute_keys))]
+        users = User.objects.filter(organizations=organization)
+
+        return [
+            (
+                'attribute filter',
+                lambda: _chained_attribute_filter(users, [organization], attribute_keys, attribute_values)
+                .values_list('id', flat=True),
+                lambda: Organization.get_all_users_by_organization_attribute_filter(
+                    users, [organization], attribute_keys, attribute_values
+                ).values_list('id', flat=True),
+            ),
+        ] + self._get_endpoint_scenarios(
+            requester,
+            [('list', 'list', {'page_size': 20}, {})] + self._get_list_by_type_endpoints(fixture) +
+            self._get_users_endpoints(fixture, organization) + self._get_courses_endpoints(organization)
+        )
+
+    @staticmethod
+    def _get_endpoint_scenarios(requester, endpoints):
+        """
+        Returns scenarios calling the given (name, action, params, kwargs) endpoints
+        through the previous and the current viewset
+        """
+        return [
+            (
+                name,
+                lambda action=action, params=params, kwargs=kwargs: _call_view(
+                    _PreviousOrganizationsViewSet, action, requester, params, **kwargs
+                ),
+                lambda action=action, params=params, kwargs=kwargs: _call_view(
+                    OrganizationsViewSet, action, requester, params, **kwargs
+                ),
+            )
+            for name, action, params, kwargs in endpoints
+        ]
+
+    @staticmethod
+    def _get_list_by_type_endpoints(fixture):
+        """
+        Returns the list endpoint filtered by the company admin type, which the previous
+        implementation resolves with one query per admin. Each admin is a member of
+        two organizations, 1k organizations with 5k admins are reproduced with:
+
+            ./manage.py lms benchmark_organizations --organizations 1000 --users 100000 --admins 5000
+        """
+        return [
+            ('list by type', 'list', {'page_size': 20, 'type': fixture['admin_type']}, {}),
+        ]
+
+    @staticmethod
+    def _get_users_endpoints(fixture, organization):
+        """
+        Returns the users endpoints, serialized one user at a time by the previous
+        implementation. Organization members are spread evenly, so a 20k member
+        organization is reproduced with:
+
+            ./manage.py lms benchmark_organizations --organizations 5 --users 100000
+        """
+        kwargs = {'pk': str(organization.id)}
+        return [
+            ('users', 'users', {'include_course_counts': 'true'}, kwargs),
+            ('users with grades', 'users', {
+                'course_id': unicode(fixture['course_keys'][0]), 'include_grades': 'true', 'include_attributes': 'true'
+            }, kwargs),
+        ]
+
+    @staticmethod
+    def _get_courses_endpoints(organization):
+        """
+        Returns the courses endpoints, whose previous implementation groups enrollments
+        with list membership tests. An organization with 200k enrollments is reproduced with:
+
+            ./manage.py lms benchmark_organizations --organizations 1 --users 100000 --enrollments 2
+        """
+        kwargs = {'pk': str(organization.id)}
+        return [
+            ('courses', 'courses', {}, kwargs),
+            ('courses without admins', 'courses', {'exclude_admins': 'true'}, kwargs),
+        ]
+
+    def _run_scenario(self, name, previous, current, options):
+        """
+        Times both implementations of a scenario and prints their durations
+        """
+        timings = []
+        for implementation in (previous, current):
+            timings.append(_time(lambda: _evaluate(implementation()), options['repeat']))
+        (previous_min, previous_median), (current_min, current_median) = timings
+        self.stdout.write(
+            '{:<24} previous {:10.1f} ms (median {:10.1f})  current {:10.1f} ms (median {:10.1f})  {:6.1f}x'.format(
+                name, previous_min, previous_median, current_min, current_median, previous_min / max(current_min, 0.001)
+            )
+        )
+        if options['explain']:
+            for label, implementation in (('previous', previous), ('current', current)):
+                result = implementation()
+                if hasattr(result, 'query'):
+                    self.stdout.write('  {} plan:'.format(label))
+                    for row in _explain(result):
+                        self.stdout.write('    {}'.format(' | '.join(str(column) for column in row)))
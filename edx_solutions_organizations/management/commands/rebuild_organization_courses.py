@@ -0,0 +1,34 @@
+"""
+Management command to rebuild the organization courses rollup table
+"""
+import logging
+from django.core.management.base import BaseCommand
+
+from edx_solutions_organizations.models import Organization, OrganizationCourse
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Recomputes OrganizationCourse rows and OrganizationStats counts of all or the given organizations
+    """
+    help = 'Rebuilds course counts of organizations from enrollments, course roles and grades of their members'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--organization',
+            action='append',
+            type=int,
+            dest='organization_ids',
+            help='Id of an organization to rebuild, may be repeated. All organizations are rebuilt if omitted.',
+        )
+
+    def handle(self, *args, **options):
+        organization_ids = options.get('organization_ids')
+        if not organization_ids:
+            organization_ids = list(Organization.objects.order_by('id').values_list('id', flat=True))
+        log.info('rebuilding courses of %d organization(s)', len(organization_ids))
+        for organization_id in organization_ids:
+            OrganizationCourse.rebuild(organization_id)
+        log.info('organization courses rebuilt')
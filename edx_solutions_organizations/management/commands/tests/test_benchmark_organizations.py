@@ -0,0 +1,44 @@
+"""
+Tests for the benchmark_organizations management command
+"""
+from StringIO import StringIO
+
+from django.contrib.auth.models import Group, User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from gradebook.models import StudentGradebook
+from student.models import CourseEnrollment
+
+from edx_solutions_organizations.models import Organization, OrganizationUsersAttributes
+
+
+class BenchmarkOrganizationsTests(TestCase):
+    """ Test suite for the benchmark_organizations command """
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command(
+            'benchmark_organizations', '--organizations', '2', '--users', '20', '--courses', '3', '--admins', '4',
+            '--repeat', '1', '--explain', stdout=out
+        )
+
+        output = out.getvalue()
+        for scenario in (
+            'attribute filter', 'list', 'list by type', 'users', 'users with grades', 'courses', 'courses without admins'
+        ):
+            self.assertIn('\n{} '.format(scenario), '\n' + output)
+        self.assertIn('current plan:', output)
+
+        # the fixture is rolled back
+        self.assertFalse(Organization.objects.exists())
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(OrganizationUsersAttributes.objects.exists())
+        self.assertFalse(CourseEnrollment.objects.exists())
+        self.assertFalse(StudentGradebook.objects.exists())
+        self.assertFalse(Group.objects.exists())
+
+    def test_benchmark_more_admins_than_users(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark_organizations', '--users', '2', '--admins', '3', stdout=StringIO())
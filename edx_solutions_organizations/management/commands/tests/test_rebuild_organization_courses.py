@@ -0,0 +1,51 @@
+"""
+Tests for the rebuild_organization_courses management command
+"""
+from django.core.management import call_command
+
+from gradebook.models import StudentGradebook
+from student.tests.factories import CourseEnrollmentFactory, UserFactory
+from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase
+from xmodule.modulestore.tests.factories import CourseFactory
+
+from edx_solutions_organizations.models import Organization, OrganizationCourse, OrganizationStats
+
+
+class RebuildOrganizationCoursesTests(ModuleStoreTestCase):
+    """ Test suite for the rebuild_organization_courses command """
+
+    def setUp(self):
+        super(RebuildOrganizationCoursesTests, self).setUp()
+        self.course = CourseFactory.create()
+        self.stale_course = CourseFactory.create()
+        self.users = UserFactory.create_batch(2)
+        self.organization = Organization.objects.create(name='Test Org')
+        self.organization.users.add(*self.users)
+        for user in self.users:
+            CourseEnrollmentFactory.create(user=user, course_id=self.course.id)
+        StudentGradebook.objects.create(user=self.users[0], course_id=self.course.id, grade=0.5, proforma_grade=0.5)
+
+    def test_rebuild(self):
+        OrganizationCourse.objects.create(organization=self.organization, course_id=self.stale_course.id)
+        call_command('rebuild_organization_courses')
+
+        organization_course = OrganizationCourse.objects.get(organization=self.organization)
+        self.assertEqual(organization_course.course_id, self.course.id)
+        self.assertEqual(organization_course.enrolled_count, 2)
+        self.assertEqual(organization_course.participant_count, 2)
+        self.assertEqual(organization_course.learner_count, 2)
+        self.assertEqual(organization_course.completed_count, 1)
+        self.assertAlmostEqual(organization_course.grade_average, 0.25)
+
+        stats = OrganizationStats.objects.get(organization=self.organization)
+        self.assertEqual((stats.member_count, stats.course_count), (2, 1))
+
+    def test_rebuild_given_organization(self):
+        other_organization = Organization.objects.create(name='Other Org')
+        other_organization.users.add(self.users[0])
+        call_command('rebuild_organization_courses', '--organization', str(other_organization.id))
+
+        self.assertFalse(OrganizationCourse.objects.filter(organization=self.organization).exists())
+        self.assertEqual(
+            OrganizationCourse.objects.get(organization=other_organization, course_id=self.course.id).enrolled_count, 1
+        )
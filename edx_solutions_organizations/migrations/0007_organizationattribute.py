@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edx_solutions_organizations', '0006_auto_20181012_1111'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrganizationAttribute',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('key', models.CharField(max_length=255)),
+                ('label', models.CharField(max_length=255)),
+                ('order', models.PositiveIntegerField()),
+                ('is_active', models.BooleanField(default=True)),
+                ('organization', models.ForeignKey(related_name='organization_attributes', to='edx_solutions_organizations.Organization')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='organizationattribute',
+            unique_together=set([('organization', 'key'), ('organization', 'label')]),
+        ),
+    ]
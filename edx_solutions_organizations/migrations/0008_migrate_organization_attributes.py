@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import logging
+
+from django.db import migrations
+from django.utils import six
+
+BATCH_SIZE = 1000
+MAX_LENGTH = 255
+
+log = logging.getLogger(__name__)
+
+
+def _get_attribute_definitions(organization_id, blob):
+    """
+    Returns (key, label, order, is_active) tuples of an organization's attributes JSON blob.
+    Missing labels fall back to the key and over long labels are truncated. Labels are
+    unique per organization now, active attributes are placed first so they keep their
+    label when an inactive attribute shares it.
+    """
+    attributes = json.loads(blob) if blob else {}
+    definitions = sorted(
+        (
+            (key, value.get('label'), int(value['order']), value.get('is_active') == True)
+            for key, value in attributes.items()
+        ),
+        key=lambda definition: (not definition[3], definition[2])
+    )
+
+    labels, keys, result = set(), set(), []
+    for key, label, order, is_active in definitions:
+        if len(key) > MAX_LENGTH:
+            log.warning('Organization %s: attribute key %s is truncated', organization_id, key)
+            key = key[:MAX_LENGTH]
+            if key in keys:
+                raise ValueError('truncated attribute key {} is not unique'.format(key))
+        keys.add(key)
+
+        label = label if isinstance(label, six.string_types) and label else key
+        if len(label) > MAX_LENGTH:
+            log.warning('Organization %s: label of attribute %s is truncated', organization_id, key)
+            label = label[:MAX_LENGTH]
+        if label in labels:
+            suffix = ' ({})'.format(key)
+            label = label[:max(MAX_LENGTH - len(suffix), 0)] + suffix
+            if label in labels or len(label) > MAX_LENGTH:
+                raise ValueError('label of attribute {} cannot be made unique'.format(key))
+        labels.add(label)
+        result.append((key, label, order, is_active))
+    return result
+
+
+def forwards(apps, schema_editor):
+    """
+    Copies attribute definitions from the Organization.attributes JSON blob to OrganizationAttribute rows.
+    The blob column is dropped by the next migration, so all blobs are read before anything is written
+    and the migration fails, naming the organizations, if any blob cannot be read.
+    """
+    Organization = apps.get_model('edx_solutions_organizations', 'Organization')
+    OrganizationAttribute = apps.get_model('edx_solutions_organizations', 'OrganizationAttribute')
+
+    definitions_by_organization, invalid_organization_ids = {}, []
+    for organization_id, blob in Organization.objects.values_list('id', 'attributes').iterator():
+        try:
+            definitions_by_organization[organization_id] = _get_attribute_definitions(organization_id, blob)
+        except (AttributeError, KeyError, TypeError, ValueError) as error:
+            log.error('Organization %s: attributes cannot be migrated: %s', organization_id, error)
+            invalid_organization_ids.append(organization_id)
+    if invalid_organization_ids:
+        raise ValueError(
+            'Attributes of organization(s) {} cannot be migrated, fix their attributes JSON and run '
+            'the migration again.'.format(', '.join(str(pk) for pk in invalid_organization_ids))
+        )
+
+    rows = []
+    for organization_id, definitions in definitions_by_organization.items():
+        rows.extend(
+            OrganizationAttribute(
+                organization_id=organization_id, key=key, label=label, order=order, is_active=is_active
+            )
+            for key, label, order, is_active in definitions
+        )
+        if len(rows) >= BATCH_SIZE:
+            OrganizationAttribute.objects.bulk_create(rows)
+            rows = []
+
+    OrganizationAttribute.objects.bulk_create(rows)
+
+
+def backwards(apps, schema_editor):
+    """
+    Writes OrganizationAttribute rows back to the Organization.attributes JSON blob
+    """
+    Organization = apps.get_model('edx_solutions_organizations', 'Organization')
+    OrganizationAttribute = apps.get_model('edx_solutions_organizations', 'OrganizationAttribute')
+
+    attributes_by_organization = {}
+    for attribute in OrganizationAttribute.objects.all().iterator():
+        attributes_by_organization.setdefault(attribute.organization_id, {})[attribute.key] = {
+            'label': attribute.label,
+            'order': attribute.order,
+            'is_active': attribute.is_active,
+        }
+
+    for organization_id, attributes in attributes_by_organization.items():
+        Organization.objects.filter(id=organization_id).update(attributes=json.dumps(attributes))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edx_solutions_organizations', '0007_organizationattribute'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
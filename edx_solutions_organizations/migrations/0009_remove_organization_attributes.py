@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edx_solutions_organizations', '0008_migrate_organization_attributes'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='organization',
+            name='attributes',
+        ),
+    ]
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+INDEX_NAME = 'org_users_attrs_org_key_value'
+# MySQL cannot index a whole TEXT column, only a prefix of it
+VALUE_PREFIX_LENGTH = 255
+
+
+def add_index(apps, schema_editor):
+    """
+    Adds a composite (organization, key, value prefix) index used to filter users by attribute values.
+    Only MySQL supports indexing a prefix of a TEXT column, other backends would index the whole
+    value and reject values above their index row size, so the index is left out there.
+    """
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    model = apps.get_model('edx_solutions_organizations', 'OrganizationUsersAttributes')
+    quote_name = schema_editor.quote_name
+    schema_editor.execute('CREATE INDEX {index} ON {table} ({organization}, {key}, {value}({length}))'.format(
+        index=quote_name(INDEX_NAME),
+        table=quote_name(model._meta.db_table),
+        organization=quote_name('organization_id'),
+        key=quote_name('key'),
+        value=quote_name('value'),
+        length=VALUE_PREFIX_LENGTH,
+    ))
+
+
+def remove_index(apps, schema_editor):
+    """
+    Removes the composite (organization, key, value prefix) index
+    """
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    model = apps.get_model('edx_solutions_organizations', 'OrganizationUsersAttributes')
+    schema_editor.execute('DROP INDEX {index} ON {table}'.format(
+        index=schema_editor.quote_name(INDEX_NAME),
+        table=schema_editor.quote_name(model._meta.db_table),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edx_solutions_organizations', '0009_remove_organization_attributes'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_index, remove_index),
+    ]
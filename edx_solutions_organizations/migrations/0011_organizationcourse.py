@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import opaque_keys.edx.django.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edx_solutions_organizations', '0010_organizationusersattributes_value_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrganizationCourse',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('course_id', opaque_keys.edx.django.models.CourseKeyField(max_length=255, db_index=True)),
+                ('enrolled_count', models.PositiveIntegerField(default=0)),
+                ('participant_count', models.PositiveIntegerField(default=0)),
+                ('learner_count', models.PositiveIntegerField(default=0)),
+                ('completed_count', models.PositiveIntegerField(default=0)),
+                ('grade_sum', models.FloatField(default=0)),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('organization', models.ForeignKey(related_name='organization_courses', to='edx_solutions_organizations.Organization')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OrganizationStats',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('member_count', models.PositiveIntegerField(default=0)),
+                ('course_count', models.PositiveIntegerField(default=0)),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('organization', models.OneToOneField(related_name='stats', to='edx_solutions_organizations.Organization')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='organizationcourse',
+            unique_together=set([('organization', 'course_id')]),
+        ),
+    ]
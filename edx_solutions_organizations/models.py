@@ -1,13 +1,42 @@
 """
 Django database models supporting the organizations app
 """
-import json
+import operator
+import re
+from collections import OrderedDict
+from functools import reduce
+
+from django.conf import settings
 from django.contrib.auth.models import Group, User
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, models, transaction
+from django.utils import six
 from django.core.validators import RegexValidator
 
 from model_utils.models import TimeStampedModel
+from opaque_keys.edx.django.models import CourseKeyField
 from edx_solutions_projects.models import Workgroup
+from gradebook.models import StudentGradebook
+from student.models import CourseAccessRole, CourseEnrollment
+
+from edx_solutions_organizations.caching import attribute_schema_cache
+from edx_solutions_organizations.utils import (
+    COURSE_ADMIN_ROLES,
+    AttributeSchema,
+    chunks,
+    generate_random_key_for_field,
+    get_aggregate_exclusion_roles,
+)
+
+
+ATTRIBUTE_MAX_LENGTH = 255
+
+
+class OrganizationAttributeConflict(Exception):
+    """
+    Raised when an attribute change conflicts with the current attribute definitions
+    """
+    pass
 
 
 class Organization(TimeStampedModel):
@@ -23,60 +52,282 @@ class Organization(TimeStampedModel):
     logo_url = models.CharField(max_length=255, blank=True, null=True)
     users = models.ManyToManyField(User, related_name="organizations", blank=True)
     groups = models.ManyToManyField(Group, related_name="organizations", blank=True)
-    # attributes are client specific fields.These are optional fields
-    # could be different for each organization
-    attributes = models.TextField(default='{}')
     include_manager_info = models.BooleanField(default=False)
 
+    _attribute_schema = None
+
+    @property
+    def attribute_schema(self):
+        """
+        Attribute definitions of the organization. Loaded once per instance and
+        reset whenever attributes are changed through this model.
+        """
+        if self._attribute_schema is None:
+            self._attribute_schema = attribute_schema_cache.get_for_instance(self)
+        return self._attribute_schema
+
+    def _attributes_changed(self):
+        """
+        Resets the loaded attribute schema and bumps `modified` so that cached
+        schemas of the previous version are no longer served.
+        """
+        self._attribute_schema = None
+        self.save(update_fields=['modified'])
+
     def is_attribute_exists(self, name):
         """
         method to check if attribute exists and is active
         """
-        attributes = json.loads(self.attributes)
-        return name in [value['label'] for key, value in attributes.items() if value['is_active'] == True]
+        return name in self.attribute_schema.active_labels
 
     def is_key_exists(self, name):
         """
         method to check if key exists and is active
         """
-        attributes = json.loads(self.attributes)
-        return name in [key for key, value in attributes.items() if value['is_active'] == True]
+        return name in self.attribute_schema.active_keys
 
     def get_all_attributes(self):
         """
         method to get all active attributes
         """
-        attributes = json.loads(self.attributes)
-        return [
-                    {
-                        'key': key,
-                        'label': value['label'],
-                        'order': value['order']
-                    } for key, value in attributes.items() if value['is_active'] == True
-                ]
+        return self.attribute_schema.get_active_attributes()
 
     def get_all_attribute_keys(self):
         """
         method to get all active attribute keys
         """
-        attributes = json.loads(self.attributes)
-        return [key for key, value in attributes.items() if value['is_active'] == True]
+        return self.attribute_schema.get_active_keys()
+
+    @staticmethod
+    def _get_label_error(label, order=None):
+        """
+        Returns why a label cannot be stored, or None. When the order of a new
+        attribute is given, the key generated from the label must fit as well.
+        """
+        if not (label and isinstance(label, six.string_types)):
+            return 'name parameter is missing.'
+        max_length = ATTRIBUTE_MAX_LENGTH
+        if order is not None:
+            max_length -= len('_{}'.format(order))
+        if len(label) > max_length:
+            return 'name must be at most {} characters long.'.format(max_length)
+        return None
 
+    def add_attribute(self, label):
+        """
+        Adds an active attribute with the given label and returns its key. An
+        inactive attribute carrying the same label is reactivated instead.
+        Raises ValidationError if the label cannot be stored and
+        OrganizationAttributeConflict if an active attribute has the label.
+        """
+        error = self._get_label_error(label)
+        if error:
+            raise ValidationError(error)
+        with transaction.atomic():
+            # lock the organization row so concurrent additions are given distinct orders
+            list(Organization.objects.select_for_update().filter(pk=self.pk).values_list('pk', flat=True))
+            attribute = self.organization_attributes.filter(label=label).first()
+            if attribute and attribute.is_active:
+                raise OrganizationAttributeConflict('Name {} already exists.'.format(label))
+            if attribute:
+                self.organization_attributes.filter(pk=attribute.pk).update(is_active=True)
+            else:
+                order = (self.organization_attributes.aggregate(models.Max('order'))['order__max'] or 0) + 1
+                error = self._get_label_error(label, order)
+                if error:
+                    raise ValidationError(error)
+                try:
+                    with transaction.atomic():
+                        attribute = self.organization_attributes.create(
+                            key=generate_random_key_for_field(label, order), label=label, order=order
+                        )
+                except IntegrityError:
+                    raise OrganizationAttributeConflict('Name {} already exists.'.format(label))
+            self._attributes_changed()
+        return attribute.key
+
+    def rename_attribute(self, key, label):
+        """
+        Changes the label of the active attribute with the given key.
+        Raises ValidationError if the label cannot be stored and
+        OrganizationAttributeConflict if the label is taken or the
+        attribute was deactivated by a concurrent request.
+        """
+        error = self._get_label_error(label)
+        if error:
+            raise ValidationError(error)
+        try:
+            with transaction.atomic():
+                updated = self.organization_attributes.filter(key=key, is_active=True).update(label=label)
+        except IntegrityError:
+            raise OrganizationAttributeConflict('Name {} already exists.'.format(label))
+        if not updated:
+            raise OrganizationAttributeConflict('Key {} was changed by another request.'.format(key))
+        self._attributes_changed()
+
+    def deactivate_attribute(self, key):
+        """
+        Marks the active attribute with the given key as inactive.
+        Raises OrganizationAttributeConflict if it was deactivated by a concurrent request.
+        """
+        updated = self.organization_attributes.filter(key=key, is_active=True).update(is_active=False)
+        if not updated:
+            raise OrganizationAttributeConflict('Key {} was changed by another request.'.format(key))
+        self._attributes_changed()
+
+    def apply_attribute_operations(self, operations):
+        """
+        Validates a batch of attribute operations against the attribute set
+        that results from applying them in order, and applies them in a single
+        transaction if all of them are valid. Supported operations are
+        `{"action": "create", "name": ...}`, `{"action": "rename", "key": ..., "name": ...}`
+        and `{"action": "deactivate", "key": ...}`.
+
+        Returns a tuple of (results, applied) where results holds the status of
+        each operation in the order they were given.
+        """
+        with transaction.atomic():
+            list(Organization.objects.select_for_update().filter(pk=self.pk).values_list('pk', flat=True))
+            existing = {attribute.key: attribute for attribute in self.organization_attributes.all()}
+            definitions = {
+                key: {'label': attribute.label, 'order': attribute.order, 'is_active': attribute.is_active}
+                for key, attribute in existing.items()
+            }
+            label_keys = {}
+            for key, definition in definitions.items():
+                label_keys.setdefault(definition['label'], set()).add(key)
+            max_order = max([definition['order'] for definition in definitions.values()] or [0])
+
+            results = []
+            labelled_by = {}
+            for index, operation in enumerate(operations):
+                action = operation.get('action') if isinstance(operation, dict) else None
+                name = operation.get('name') if action else None
+                key = operation.get('key') if action else None
+                definition = definitions.get(key) if isinstance(key, six.string_types) else None
+                if action in ('rename', 'deactivate') and not isinstance(key, six.string_types):
+                    results.append({'status': 400, 'key': key, 'detail': 'key parameter is missing.'})
+                elif action in ('create', 'rename') and self._get_label_error(name):
+                    results.append({'status': 400, 'key': key, 'detail': self._get_label_error(name)})
+                elif action == 'create':
+                    keys = label_keys.setdefault(name, set())
+                    key = next(iter(keys)) if len(keys) == 1 else None
+                    if key and not definitions[key]['is_active']:
+                        definitions[key]['is_active'] = True
+                        results.append({'status': 201, 'key': key, 'label': name})
+                    elif self._get_label_error(name, max_order + 1):
+                        # the key generated from the label would not fit
+                        results.append({'status': 400, 'detail': self._get_label_error(name, max_order + 1)})
+                    else:
+                        max_order += 1
+                        key = generate_random_key_for_field(name, max_order)
+                        definitions[key] = {'label': name, 'order': max_order, 'is_active': True}
+                        keys.add(key)
+                        labelled_by[key] = index
+                        results.append({'status': 201, 'key': key, 'label': name})
+                elif action in ('rename', 'deactivate') and not (definition and definition['is_active']):
+                    results.append({'status': 404, 'key': key, 'detail': 'Key {} does not exists.'.format(key)})
+                elif action == 'rename':
+                    label_keys[definition['label']].discard(key)
+                    label_keys.setdefault(name, set()).add(key)
+                    definition['label'] = name
+                    labelled_by[key] = index
+                    results.append({'status': 200, 'key': key, 'label': name})
+                elif action == 'deactivate':
+                    definition['is_active'] = False
+                    results.append({'status': 200, 'key': key, 'label': definition['label']})
+                else:
+                    results.append({'status': 400, 'detail': 'action must be one of create, rename or deactivate.'})
+
+            # labels must be unique in the resulting attribute set
+            for label, keys in label_keys.items():
+                if len(keys) > 1:
+                    for key in keys:
+                        if key in labelled_by:
+                            results[labelled_by[key]] = {
+                                'status': 409, 'key': key, 'detail': 'Name {} already exists.'.format(label)
+                            }
+
+            if any(result['status'] >= 400 for result in results):
+                return results, False
+
+            renamed = {
+                attribute.pk: definitions[key]['label'] for key, attribute in existing.items()
+                if definitions[key]['label'] != attribute.label
+            }
+            if renamed:
+                # labels are moved aside first so that labels swapped within the batch do not collide
+                for labels in ({pk: '__renaming__{}'.format(pk) for pk in renamed}, renamed):
+                    self.organization_attributes.filter(pk__in=renamed.keys()).update(label=models.Case(
+                        *[models.When(pk=pk, then=models.Value(label)) for pk, label in labels.items()],
+                        output_field=models.CharField()
+                    ))
+            for is_active in (True, False):
+                pks = [
+                    attribute.pk for key, attribute in existing.items()
+                    if definitions[key]['is_active'] == is_active and attribute.is_active != is_active
+                ]
+                if pks:
+                    self.organization_attributes.filter(pk__in=pks).update(is_active=is_active)
+            OrganizationAttribute.objects.bulk_create([
+                OrganizationAttribute(organization=self, key=key, **definition)
+                for key, definition in definitions.items() if key not in existing
+            ])
+            self._attributes_changed()
+        return results, True
 
     @staticmethod
     def get_all_users_by_organization_attribute_filter(users, organizations, attribute_keys, attribute_values):
-        attribute_active_keys = []
-        for organization in organizations:
-            attribute_active_keys = attribute_active_keys + organization.get_all_attribute_keys()
+        """
+        Filters users down to those having all of the given attribute values in
+        the given organizations. Keys which are not active attributes of the
+        organizations are ignored. All conditions are matched by a single
+        grouped subquery instead of one join per attribute.
+        """
+        attribute_active_keys = set(OrganizationAttribute.objects.filter(
+            organization__in=organizations, key__in=attribute_keys, is_active=True
+        ).values_list('key', flat=True))
+        conditions = set(
+            (attribute_key, attribute_values[i]) for i, attribute_key in enumerate(attribute_keys)
+            if attribute_key in attribute_active_keys
+        )
+        if not conditions:
+            return users
+
+        matching_user_ids = OrganizationUsersAttributes.objects.filter(
+            reduce(operator.or_, [models.Q(key=key, value=value) for key, value in conditions]),
+            organization__in=organizations,
+        ).order_by().values('user_id').annotate(
+            matched_keys=models.Count('key', distinct=True)
+        ).filter(matched_keys=len(conditions)).values('user_id')
+        return users.filter(id__in=matching_user_ids)
+
 
-        for i, attribute_key in enumerate(attribute_keys):
-            if attribute_key in attribute_active_keys:
-                users = users.filter(
-                    user_attributes__key=attribute_key,
-                    user_attributes__value=attribute_values[i],
-                    user_attributes__organization_id__in=organizations,
-                ).all()
-        return users
+class OrganizationAttribute(models.Model):
+    """
+    Attributes are client specific fields defined per organization. Values of
+    these fields are stored per user in OrganizationUsersAttributes.
+    """
+    organization = models.ForeignKey(Organization, related_name="organization_attributes")
+    key = models.CharField(max_length=255)
+    label = models.CharField(max_length=255)
+    order = models.PositiveIntegerField()
+    is_active = models.BooleanField(default=True)
+
+    class Meta(object):
+        """
+        Meta class for setting model meta options
+        """
+        unique_together = (("organization", "key"), ("organization", "label"))
+
+    @classmethod
+    def get_schema(cls, organization_id):
+        """
+        Loads the attribute schema of the given organization
+        """
+        return AttributeSchema(
+            cls.objects.filter(organization_id=organization_id).values_list('key', 'label', 'order', 'is_active')
+        )
 
 
 class OrganizationGroupUser(TimeStampedModel):
@@ -105,6 +356,88 @@ class OrganizationUsersAttributes(models.Model):
 
     class Meta(object):
         unique_together = ("user", "key")
+        # organization_id, key, value(255) index is created on MySQL by migration 0010
+
+    @classmethod
+    def bulk_upsert(cls, organization, rows, batch_size=None):
+        """
+        Creates or updates attribute values of users for the given organization.
+        All rows are validated first and nothing is written if any row is invalid.
+        Values are unique per user and key, so a row whose user already has a value
+        for the key under another organization is reported as invalid.
+        :param organization: organization the attribute keys belong to
+        :param rows: iterable of (user_id, key, value) tuples
+        :param batch_size: number of rows written per query
+        :return: tuple of (number of created rows, number of updated rows)
+        """
+        batch_size = batch_size or getattr(settings, 'ORGANIZATION_USERS_ATTRIBUTES_BATCH_SIZE', 1000)
+        active_keys = organization.attribute_schema.active_keys
+        key_regex = re.compile(cls.KEY_REGEX)
+
+        values = OrderedDict()
+        errors = []
+        for index, (user_id, key, value) in enumerate(rows):
+            try:
+                user_id = int(user_id)
+            except (TypeError, ValueError):
+                errors.append('Row {}: user id {} is not valid.'.format(index, user_id))
+                continue
+            if not isinstance(key, six.string_types) or key not in active_keys or not key_regex.search(key):
+                errors.append('Row {}: key {} is not an active attribute key.'.format(index, key))
+            elif value is None:
+                errors.append('Row {}: value is missing.'.format(index))
+            else:
+                values[(user_id, key)] = six.text_type(value)
+
+        user_ids = set(user_id for user_id, __ in values)
+        existing_user_ids = set()
+        for chunk in chunks(list(user_ids), batch_size):
+            existing_user_ids.update(User.objects.filter(id__in=chunk).values_list('id', flat=True))
+        for user_id in user_ids - existing_user_ids:
+            errors.append('User {} does not exist.'.format(user_id))
+        for chunk in chunks(list(values), batch_size):
+            foreign = cls.objects.filter(
+                user_id__in=set(user_id for user_id, __ in chunk),
+                key__in=set(key for __, key in chunk),
+            ).exclude(organization=organization).values_list('user_id', 'key')
+            for user_id, key in foreign:
+                if (user_id, key) in values:
+                    errors.append(
+                        'User {} already has a value for key {} in another organization.'.format(user_id, key)
+                    )
+        if errors:
+            raise ValidationError(errors)
+
+        created = updated = 0
+        with transaction.atomic():
+            for chunk in chunks(list(values.items()), batch_size):
+                chunk_values = dict(chunk)
+                existing = cls.objects.filter(
+                    organization=organization,
+                    user_id__in=set(user_id for user_id, __ in chunk_values),
+                    key__in=set(key for __, key in chunk_values),
+                ).values_list('id', 'user_id', 'key', 'value')
+
+                changed = {}
+                for pk, user_id, key, value in existing:
+                    new_value = chunk_values.pop((user_id, key), None)
+                    if new_value is not None and new_value != value:
+                        changed[pk] = new_value
+
+                cls.objects.bulk_create([
+                    cls(user_id=user_id, key=key, organization=organization, value=value)
+                    for (user_id, key), value in chunk_values.items()
+                ])
+                if changed:
+                    cls.objects.filter(id__in=changed.keys()).update(
+                        value=models.Case(
+                            *[models.When(id=pk, then=models.Value(value)) for pk, value in changed.items()],
+                            output_field=models.TextField()
+                        )
+                    )
+                created += len(chunk_values)
+                updated += len(changed)
+        return created, updated
 
     @classmethod
     def get_value(cls, user, attribute_key, default=None):
@@ -115,3 +448,215 @@ class OrganizationUsersAttributes(models.Model):
             return attribute.value
         except cls.DoesNotExist:
             return default
+
+    @classmethod
+    def get_values(cls, users, attribute_keys, default=None, batch_size=None, organization=None):
+        """Gets the user attributes values of many users for the given keys.
+        Values are read with one query per batch of users.
+        :param users: users, user ids or a queryset of users
+        :param attribute_keys: keys of the attributes to read
+        :param default: value used for users which have no value for a key
+        :param batch_size: number of users read per query
+        :param organization: organization the values belong to. Keys repeat across
+            organizations, so values of any organization are read if None
+        :return: dict of {user_id: {key: value}}
+        """
+        if isinstance(users, models.QuerySet):
+            user_ids = list(users.values_list('id', flat=True))
+        else:
+            user_ids = [getattr(user, 'id', user) for user in users]
+        attribute_keys = list(attribute_keys)
+        batch_size = batch_size or getattr(settings, 'ORGANIZATION_USERS_ATTRIBUTES_BATCH_SIZE', 1000)
+
+        values = {user_id: dict.fromkeys(attribute_keys, default) for user_id in user_ids}
+        if not attribute_keys:
+            return values
+        queryset = cls.objects.filter(key__in=attribute_keys)
+        if organization is not None:
+            queryset = queryset.filter(organization=organization)
+        for chunk in chunks(user_ids, batch_size):
+            attributes = queryset.filter(user_id__in=chunk).values_list('user_id', 'key', 'value')
+            for user_id, key, value in attributes.iterator():
+                values[user_id][key] = value
+        return values
+
+
+class OrganizationCourse(models.Model):
+    """
+    Denormalized per organization and course counts of organization members.
+    A row exists for every course in which a member has an enrollment, so the
+    number of rows of an organization is its number of courses. Rows are kept
+    up to date by signal receivers when ORGANIZATION_COURSES_ROLLUP_ENABLED is
+    set and can be rebuilt with the rebuild_organization_courses command.
+    """
+    organization = models.ForeignKey(Organization, related_name="organization_courses")
+    course_id = CourseKeyField(max_length=255, db_index=True)
+    # members with an active enrollment
+    enrolled_count = models.PositiveIntegerField(default=0)
+    # members with an active enrollment and no course admin role
+    participant_count = models.PositiveIntegerField(default=0)
+    # active members with an active enrollment, left out of aggregates by AGGREGATION_EXCLUDE_ROLES
+    learner_count = models.PositiveIntegerField(default=0)
+    # learners whose proforma grade is reached, and the sum of learner grades
+    completed_count = models.PositiveIntegerField(default=0)
+    grade_sum = models.FloatField(default=0)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta(object):
+        unique_together = ("organization", "course_id")
+
+    @property
+    def grade_average(self):
+        """
+        Average grade of the learners of the course
+        """
+        return self.grade_sum / self.learner_count if self.learner_count else 0
+
+    @classmethod
+    def refresh(cls, organization_id, course_keys=None):
+        """
+        Recomputes the rows of an organization with three grouped enrollment queries and
+        one grouped gradebook query. Only the rows being refreshed are locked, so a refresh
+        does not wait for writes to other courses or to the organization itself.
+        :param organization_id: id of the organization to refresh
+        :param course_keys: courses to refresh, all courses of the organization if None
+        """
+        if course_keys is not None:
+            course_keys = list(course_keys)
+            if not course_keys:
+                return
+        grade_complete_match_range = getattr(settings, 'GRADEBOOK_GRADE_COMPLETE_PROFORMA_MATCH_RANGE', 0.01)
+        excluded_roles = get_aggregate_exclusion_roles()
+
+        def course_roles(roles):
+            """ Correlated course roles of an enrollment or gradebook row """
+            return CourseAccessRole.objects.filter(
+                user_id=models.OuterRef('user_id'), course_id=models.OuterRef('course_id'), role__in=roles
+            )
+
+        with transaction.atomic():
+            rows = cls.objects.select_for_update().filter(organization_id=organization_id)
+            enrollments = CourseEnrollment.objects.filter(user__organizations=organization_id)
+            gradebooks = StudentGradebook.objects.filter(user__organizations=organization_id, user__is_active=True)
+            if course_keys is not None:
+                rows = rows.filter(course_id__in=course_keys)
+                enrollments = enrollments.filter(course_id__in=course_keys)
+                gradebooks = gradebooks.filter(course_id__in=course_keys)
+            rows = {row.course_id: row for row in rows}
+
+            enrolled = dict(
+                enrollments.order_by().values_list('course_id').annotate(total=models.Count(
+                    models.Case(models.When(is_active=True, then=models.F('user'))), distinct=True
+                ))
+            )
+            participants = dict(
+                enrollments.filter(is_active=True)
+                .annotate(is_admin=models.Exists(course_roles(COURSE_ADMIN_ROLES))).filter(is_admin=False)
+                .order_by().values_list('course_id').annotate(total=models.Count('user', distinct=True))
+            )
+            learners = dict(
+                enrollments.filter(is_active=True, user__is_active=True)
+                .annotate(is_excluded=models.Exists(course_roles(excluded_roles))).filter(is_excluded=False)
+                .order_by().values_list('course_id').annotate(total=models.Count('user', distinct=True))
+            )
+            grades = {
+                row['course_id']: row for row in
+                gradebooks.annotate(is_excluded=models.Exists(course_roles(excluded_roles))).filter(is_excluded=False)
+                .order_by().values('course_id').annotate(
+                    grade_sum=models.Sum('grade'),
+                    completed=models.Count(
+                        models.Case(models.When(
+                            proforma_grade__lte=models.F('grade') + grade_complete_match_range,
+                            proforma_grade__gt=0,
+                            then=models.F('user')
+                        )),
+                        distinct=True
+                    )
+                )
+            }
+
+            for course_key in enrolled:
+                row = rows.pop(course_key, None) or cls(organization_id=organization_id, course_id=course_key)
+                course_grades = grades.get(course_key, {})
+                row.enrolled_count = enrolled[course_key]
+                row.participant_count = participants.get(course_key, 0)
+                row.learner_count = learners.get(course_key, 0)
+                row.completed_count = course_grades.get('completed') or 0
+                row.grade_sum = course_grades.get('grade_sum') or 0
+                if row.pk:
+                    row.save()
+                    continue
+                try:
+                    with transaction.atomic():
+                        row.save()
+                except IntegrityError:
+                    # inserted by a concurrent refresh, which computed the same committed state
+                    cls.objects.filter(organization_id=organization_id, course_id=course_key).update(
+                        enrolled_count=row.enrolled_count,
+                        participant_count=row.participant_count,
+                        learner_count=row.learner_count,
+                        completed_count=row.completed_count,
+                        grade_sum=row.grade_sum,
+                    )
+
+            # courses in which no member is enrolled any more
+            if rows:
+                cls.objects.filter(pk__in=[row.pk for row in rows.values()]).delete()
+
+    @classmethod
+    def rebuild(cls, organization_id):
+        """
+        Recomputes all rows and the member and course counts of an organization
+        """
+        cls.refresh(organization_id)
+        OrganizationStats.refresh(organization_id)
+
+    @classmethod
+    def refresh_for_users(cls, user_ids, course_key=None, organization_ids=None):
+        """
+        Recomputes the rows affected by changes to the given users.
+        :param user_ids: ids of the changed users
+        :param course_key: changed course, all courses of the users if None
+        :param organization_ids: changed organizations, all organizations of the users if None
+        """
+        user_ids = list(user_ids)
+        if organization_ids is None:
+            organization_ids = Organization.objects.filter(users__in=user_ids).distinct().values_list('id', flat=True)
+        if course_key is None:
+            course_keys = list(
+                CourseEnrollment.objects.filter(user_id__in=user_ids).order_by()
+                .values_list('course_id', flat=True).distinct()
+            )
+        else:
+            course_keys = [course_key]
+        for organization_id in list(organization_ids):
+            cls.refresh(organization_id, course_keys)
+            OrganizationStats.refresh(organization_id)
+
+
+class OrganizationStats(models.Model):
+    """
+    Denormalized member and course counts of an organization, kept up to date
+    together with OrganizationCourse rows
+    """
+    organization = models.OneToOneField(Organization, related_name="stats")
+    member_count = models.PositiveIntegerField(default=0)
+    course_count = models.PositiveIntegerField(default=0)
+    modified = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def refresh(cls, organization_id):
+        """
+        Recounts the members and the OrganizationCourse rows of an organization
+        """
+        counts = {
+            'member_count': Organization.users.through.objects.filter(organization_id=organization_id).count(),
+            'course_count': OrganizationCourse.objects.filter(organization_id=organization_id).count(),
+        }
+        if cls.objects.filter(organization_id=organization_id).update(**counts):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(organization_id=organization_id, **counts)
+        except IntegrityError:
+            cls.objects.filter(organization_id=organization_id).update(**counts)
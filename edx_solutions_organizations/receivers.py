@@ -0,0 +1,157 @@
+"""
+Signal receivers for the organizations app
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from gradebook.models import StudentGradebook
+from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
+from student.models import CourseAccessRole, CourseEnrollment
+from xmodule.modulestore.django import SignalHandler
+
+from edx_solutions_organizations.caching import attribute_schema_cache, course_overview_cache, metrics_cache
+from edx_solutions_organizations.models import Organization, OrganizationCourse
+
+
+@receiver(post_save, sender=Organization)
+def stamp_attribute_schema_version(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Drops the attribute schema version of an organization when it is written and
+    stamps the new version once the write is committed. A lookup running inside
+    the write window may stamp the previous version, which the commit replaces.
+    """
+    organization_id, version = instance.pk, instance.modified
+    attribute_schema_cache.invalidate(organization_id)
+    transaction.on_commit(lambda: attribute_schema_cache.invalidate(organization_id, version=version))
+
+
+@receiver(post_delete, sender=Organization)
+def invalidate_attribute_schema_cache(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Drops the cached attribute schema when an organization is deleted, and again
+    once the deletion is committed
+    """
+    organization_id = instance.pk
+    attribute_schema_cache.invalidate(organization_id)
+    transaction.on_commit(lambda: attribute_schema_cache.invalidate(organization_id))
+
+
+def _invalidate_metrics(organization_ids):
+    """
+    Drops cached metrics of the organizations now and again once the current
+    transaction is committed, so metrics computed inside the write window from
+    the previous data are not served afterwards
+    """
+    organization_ids = list(organization_ids)
+    for organization_id in organization_ids:
+        metrics_cache.invalidate(organization_id)
+
+    def invalidate_committed():
+        for organization_id in organization_ids:
+            metrics_cache.invalidate(organization_id)
+    transaction.on_commit(invalidate_committed)
+
+
+@receiver(post_save, sender=StudentGradebook)
+@receiver(post_delete, sender=StudentGradebook)
+@receiver(post_save, sender=CourseEnrollment)
+@receiver(post_delete, sender=CourseEnrollment)
+@receiver(post_save, sender=CourseAccessRole)
+@receiver(post_delete, sender=CourseAccessRole)
+def invalidate_user_organizations_metrics(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Drops cached metrics of the organizations of a user whose grades, enrollments
+    or course roles are written
+    """
+    _invalidate_metrics(Organization.objects.filter(users=instance.user_id).values_list('id', flat=True))
+
+
+@receiver(m2m_changed, sender=Organization.users.through)
+def invalidate_organization_metrics(sender, instance, action, reverse, pk_set, **kwargs):  # pylint: disable=unused-argument
+    """
+    Drops cached metrics of organizations whose members change
+    """
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            _invalidate_metrics([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        # instance is the user and pk_set holds organization ids
+        _invalidate_metrics(pk_set)
+    elif action == 'pre_clear':
+        _invalidate_metrics(instance.organizations.values_list('id', flat=True))
+
+
+def _courses_rollup_enabled():
+    return getattr(settings, 'ORGANIZATION_COURSES_ROLLUP_ENABLED', False)
+
+
+def _refresh_courses_rollup(user_ids, course_key=None, organization_ids=None):
+    """
+    Refreshes the rollup rows affected by changes to the given users once the current
+    transaction is committed, so the rows are computed from committed data and no
+    rollup row is locked while the writer's transaction is open
+    """
+    user_ids = list(user_ids)
+    organization_ids = list(organization_ids) if organization_ids is not None else None
+    transaction.on_commit(
+        lambda: OrganizationCourse.refresh_for_users(user_ids, course_key=course_key, organization_ids=organization_ids)
+    )
+
+
+@receiver(post_save, sender=StudentGradebook)
+@receiver(post_delete, sender=StudentGradebook)
+@receiver(post_save, sender=CourseEnrollment)
+@receiver(post_delete, sender=CourseEnrollment)
+@receiver(post_save, sender=CourseAccessRole)
+@receiver(post_delete, sender=CourseAccessRole)
+def refresh_user_organization_courses(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Refreshes the course rollup of the organizations of a user whose grade, enrollment
+    or course role in a course is written
+    """
+    if _courses_rollup_enabled() and instance.course_id:
+        _refresh_courses_rollup([instance.user_id], course_key=instance.course_id)
+
+
+@receiver(m2m_changed, sender=Organization.users.through)
+def refresh_membership_organization_courses(sender, instance, action, reverse, pk_set, **kwargs):  # pylint: disable=unused-argument
+    """
+    Refreshes the course rollup of organizations whose members change
+    """
+    if not _courses_rollup_enabled():
+        return
+    if not reverse:
+        if action in ('post_add', 'post_remove'):
+            _refresh_courses_rollup(pk_set, organization_ids=[instance.pk])
+        elif action == 'post_clear':
+            organization_id = instance.pk
+            transaction.on_commit(lambda: OrganizationCourse.rebuild(organization_id))
+    elif action in ('post_add', 'post_remove'):
+        # instance is the user and pk_set holds organization ids
+        _refresh_courses_rollup([instance.pk], organization_ids=pk_set)
+    elif action == 'pre_clear':
+        instance._cleared_organization_ids = list(  # pylint: disable=protected-access
+            instance.organizations.values_list('id', flat=True)
+        )
+    elif action == 'post_clear':
+        _refresh_courses_rollup([instance.pk], organization_ids=getattr(instance, '_cleared_organization_ids', []))
+
+
+@receiver(SignalHandler.course_published)
+@receiver(SignalHandler.course_deleted)
+def invalidate_published_course_overview(sender, course_key, **kwargs):  # pylint: disable=unused-argument
+    """
+    Drops the cached overview of a course when it is published or deleted
+    """
+    course_overview_cache.invalidate(course_key)
+
+
+@receiver(post_save, sender=CourseOverview)
+@receiver(post_delete, sender=CourseOverview)
+def invalidate_course_overview(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Drops the cached overview of a course when its overview is written
+    """
+    course_overview_cache.invalidate(instance.id)
@@ -47,7 +47,7 @@ class OrganizationAttributesSerializer(serializers.ModelSerializer):
     class Meta:
         """ Serializer/field specification """
         model = Organization
-        fields = ('attributes', 'id')
+        fields = ('id',)
 
     def to_representation(self, instance):
         return instance.get_all_attributes()
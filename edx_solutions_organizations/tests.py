@@ -4,22 +4,42 @@
 Run these tests @ Devstack:
 paver test_system -s lms -t organizations
 """
+import csv
+import json
+import threading
 import uuid
+from importlib import import_module
+from unittest import skipUnless
+
 import mock
 import ddt
 from urllib import urlencode
+from urlparse import parse_qs, urlparse
 
 from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase
 from django.test.client import Client
 from django.contrib.auth.models import User, Group
 from django.core.cache import cache
-from django.test.utils import override_settings
+from django.core.exceptions import ValidationError
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.utils.translation import ugettext as _
+from rest_framework.test import APIRequestFactory, force_authenticate
 
 from gradebook.models import StudentGradebook
-from .models import OrganizationGroupUser
-from student.models import UserProfile
-from student.roles import CourseObserverRole
+from .caching import attribute_schema_cache, course_overview_cache, metrics_cache
+from .models import (
+    Organization,
+    OrganizationAttribute,
+    OrganizationCourse,
+    OrganizationGroupUser,
+    OrganizationStats,
+    OrganizationUsersAttributes,
+)
+from .views import OrganizationAttributesView
+from student.models import CourseEnrollment, UserProfile
+from student.roles import CourseObserverRole, CourseStaffRole
 from student.tests.factories import CourseEnrollmentFactory, UserFactory, GroupFactory, CourseAccessRoleFactory
 from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
 from xmodule.modulestore.tests.factories import CourseFactory
@@ -80,6 +100,7 @@ class OrganizationsApiTests(ModuleStoreTestCase, APIClientMixin):
         )
 
         cache.clear()
+        course_overview_cache.clear()
 
     def setup_test_organization(self, org_data=None):
         """
@@ -103,6 +124,20 @@ class OrganizationsApiTests(ModuleStoreTestCase, APIClientMixin):
         self.assertEqual(response.status_code, 201)
         return response.data
 
+    def get_query_count(self, uri, query_parameters=None, models=None):
+        """
+        Performs a GET request on the given uri and returns the number of database
+        queries it issued, optionally only counting queries on the tables of given models
+        """
+        with CaptureQueriesContext(connection) as context:
+            response = self.do_get(uri, query_parameters=query_parameters)
+        self.assertEqual(response.status_code, 200)
+        tables = [model._meta.db_table for model in models or []]
+        return len([
+            query for query in context.captured_queries
+            if not tables or any(table in query['sql'] for table in tables)
+        ])
+
     def test_organizations_list_post(self):
         users = []
         for i in xrange(1, 6):
@@ -233,6 +268,32 @@ class OrganizationsApiTests(ModuleStoreTestCase, APIClientMixin):
         response = self.do_get('{}?type={}'.format(test_uri, self.test_group_name))
         self.assertEqual(response.data['results'][1]['number_of_courses'], 1)
 
+    def test_organizations_list_get_exclude_admins_query_count(self):
+        organizations = [Organization.objects.create(name='Test Organization {}'.format(i)) for i in xrange(3)]
+        response = self.do_post(self.base_groups_uri, {'name': self.test_group_name, 'type': 'permission'})
+        self.assertEqual(response.status_code, 201)
+        group = Group.objects.get(id=response.data['id'])
+
+        def add_admin(member_of):
+            admin = UserFactory.create()
+            admin.groups.add(group)
+            admin.organizations.add(*member_of)
+            CourseEnrollmentFactory.create(user=admin, course_id=self.course.id)
+            return admin
+
+        add_admin(organizations[:2])
+        test_uri = self.base_organizations_uri
+        query_parameters = {'type': self.test_group_name}
+        query_count = self.get_query_count(test_uri, query_parameters=query_parameters)
+        response = self.do_get(test_uri, query_parameters=query_parameters)
+        self.assertEqual([org['number_of_courses'] for org in response.data['results']], [1, 0, 0])
+
+        for i in xrange(4):
+            add_admin(organizations[1:])
+        self.assertEqual(self.get_query_count(test_uri, query_parameters=query_parameters), query_count)
+        response = self.do_get(test_uri, query_parameters=query_parameters)
+        self.assertEqual([org['number_of_courses'] for org in response.data['results']], [1, 1, 0])
+
     def test_organizations_list_number_of_participants(self):
         """
         Test number_of_participants field in organization list
@@ -260,6 +321,29 @@ class OrganizationsApiTests(ModuleStoreTestCase, APIClientMixin):
         response = self.do_get(self.base_organizations_uri)
         self.assertEqual(response.data['results'][0]['number_of_participants'], number_of_participants)
 
+    def test_organizations_list_counts_without_grouping(self):
+        users = UserFactory.create_batch(3)
+        organization = self.setup_test_organization(org_data={'users': [user.id for user in users]})
+        for user in users:
+            CourseEnrollmentFactory.create(user=user, course_id=self.course.id)
+            CourseEnrollmentFactory.create(user=user, course_id=self.second_course.id)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.do_get(self.base_organizations_uri, query_parameters={'ids': organization['id']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['number_of_courses'], 2)
+        self.assertEqual(response.data['results'][0]['number_of_participants'], 3)
+
+        # organizations are not grouped over a join of their members and enrollments
+        organization_table = Organization._meta.db_table
+        list_queries = [
+            query['sql'] for query in context.captured_queries
+            if 'COUNT(DISTINCT' in query['sql'] and organization_table in query['sql']
+        ]
+        self.assertTrue(list_queries)
+        for sql in list_queries:
+            self.assertNotIn('GROUP BY', sql)
+
     def test_organizations_list_get_filter_by_display_name(self):
         organizations = []
         organizations.append(self.setup_test_organization(org_data={'display_name': 'Abc Organization'}))
@@ -376,6 +460,37 @@ class OrganizationsApiTests(ModuleStoreTestCase, APIClientMixin):
         response = self.do_post(users_uri, data)
         self.assertEqual(response.status_code, 400)
 
+    def test_organizations_users_post_bulk(self):
+        organization = self.setup_test_organization(org_data={'users': [self.test_user.id]})
+        users = UserFactory.create_batch(3)
+        users_uri = '{}{}/users/'.format(self.base_organizations_uri, organization['id'])
+        modified = Organization.objects.get(id=organization['id']).modified
+
+        data = {'users': [user.id for user in users] + [self.test_user.id, 123456]}
+        response = self.do_post(users_uri, data)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {
+            'added': sorted(user.id for user in users),
+            'already_present': [self.test_user.id],
+            'unknown': [123456],
+        })
+        self.assertEqual(
+            set(Organization.objects.get(id=organization['id']).users.values_list('id', flat=True)),
+            set([self.test_user.id] + [user.id for user in users])
+        )
+        # the organization row is not rewritten
+        self.assertEqual(Organization.objects.get(id=organization['id']).modified, modified)
+
+        response = self.do_post(users_uri, {'users': '{},{}'.format(users[0].id, self.test_user2.id)})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['added'], [self.test_user2.id])
+        self.assertEqual(response.data['already_present'], [users[0].id])
+
+        response = self.do_post(users_uri, {'users': 'invalid'})
+        self.assertEqual(response.status_code, 400)
+        response = self.do_post('{}{}/users/'.format(self.base_organizations_uri, 123456), {'users': [users[0].id]})
+        self.assertEqual(response.status_code, 404)
+
     def test_organizations_groups_get_post(self):
         organization = self.setup_test_organization()
 
@@ -457,6 +572,77 @@ class OrganizationsApiTests(ModuleStoreTestCase, APIClientMixin):
         self.assertEqual(response.data[1]['id'], unicode(courses[1].id))
         self.assertEqual(len(response.data[1]['enrolled_users']), 1)
 
+    def test_organizations_courses_get_grouped_enrollments(self):
+        courses = CourseFactory.create_batch(3)
+        users = UserFactory.create_batch(6)
+        organization = self.setup_test_organization(org_data={'users': [user.id for user in users]})
+        for course in courses:
+            CourseOverview.get_from_id(course.id)
+        for i, user in enumerate(users):
+            for course in courses[:i % 3 + 1]:
+                CourseEnrollmentFactory.create(user=user, course_id=course.id)
+
+        courses_uri = '{}{}/courses/'.format(self.base_organizations_uri, organization['id'])
+        # enrollments of all courses are read and grouped from a single query
+        self.assertEqual(self.get_query_count(courses_uri, models=[CourseEnrollment]), 1)
+        response = self.do_get(courses_uri)
+        self.assertEqual(response.status_code, 200)
+        enrolled_users = {course['id']: sorted(course['enrolled_users']) for course in response.data}
+        self.assertEqual(enrolled_users, {
+            unicode(courses[0].id): sorted(user.id for user in users),
+            unicode(courses[1].id): sorted(user.id for i, user in enumerate(users) if i % 3 > 0),
+            unicode(courses[2].id): sorted(user.id for i, user in enumerate(users) if i % 3 == 2),
+        })
+
+    def test_organizations_courses_get_enrolled_users_count(self):
+        courses = CourseFactory.create_batch(2)
+        users = UserFactory.create_batch(3)
+        organization = self.setup_test_organization(org_data={'users': [user.id for user in users]})
+        for course in courses:
+            CourseOverview.get_from_id(course.id)
+        for user in users:
+            CourseEnrollmentFactory.create(user=user, course_id=courses[0].id)
+        CourseEnrollmentFactory.create(user=users[0], course_id=courses[1].id)
+        CourseAccessRoleFactory.create(user=users[1], course_id=courses[0].id, role=CourseObserverRole.ROLE)
+
+        courses_uri = '{}{}/courses/'.format(self.base_organizations_uri, organization['id'])
+        response = self.do_get(courses_uri, query_parameters={'count_enrolled_users': 'true'})
+        self.assertEqual(response.status_code, 200)
+        enrolled_users_count = {course['id']: course['enrolled_users_count'] for course in response.data}
+        self.assertEqual(enrolled_users_count, {unicode(courses[0].id): 3, unicode(courses[1].id): 1})
+        self.assertTrue(all('enrolled_users' not in course for course in response.data))
+
+        response = self.do_get(courses_uri, query_parameters={'count_enrolled_users': 'true', 'exclude_admins': 'true'})
+        self.assertEqual(response.status_code, 200)
+        enrolled_users_count = {course['id']: course['enrolled_users_count'] for course in response.data}
+        self.assertEqual(enrolled_users_count, {unicode(courses[0].id): 2, unicode(courses[1].id): 1})
+
+    def test_organizations_courses_get_cached_overviews(self):
+        courses = CourseFactory.create_batch(2)
+        users = UserFactory.create_batch(2)
+        organization = self.setup_test_organization(org_data={'users': [user.id for user in users]})
+        for i, course in enumerate(courses):
+            CourseOverview.get_from_id(course.id)
+            CourseEnrollmentFactory.create(user=users[i], course_id=course.id)
+
+        courses_uri = '{}{}/courses/'.format(self.base_organizations_uri, organization['id'])
+        response = self.do_get(courses_uri)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(course_overview_cache.stats()['misses'], 2)
+        response = self.do_get(courses_uri)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(course_overview_cache.stats()['hits'], 2)
+        self.assertEqual([course['id'] for course in response.data], [unicode(course.id) for course in courses])
+
+        # writing an overview drops it from the cache
+        overview = CourseOverview.objects.get(id=courses[0].id)
+        overview.mobile_available = True
+        overview.save()
+        response = self.do_get(courses_uri, query_parameters={'mobile_available': 'true'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([course['id'] for course in response.data], [unicode(courses[0].id)])
+        self.assertEqual(course_overview_cache.stats()['misses'], 3)
+
     def test_organizations_courses_get_exclude_admins(self):
         organization = self.setup_test_organization()
         course = CourseFactory.create()
@@ -477,6 +663,29 @@ class OrganizationsApiTests(ModuleStoreTestCase, APIClientMixin):
         self.assertEqual(response.data[0]['id'], unicode(course.id))
         self.assertEqual(len(response.data[0]['enrolled_users']), 1)
 
+    def test_organizations_courses_get_exclude_admins_per_course(self):
+        courses = CourseFactory.create_batch(2)
+        users = UserFactory.create_batch(2)
+        organization = self.setup_test_organization(org_data={'users': [user.id for user in users]})
+        for course in courses:
+            CourseOverview.get_from_id(course.id)
+            for user in users:
+                CourseEnrollmentFactory.create(user=user, course_id=course.id)
+        CourseAccessRoleFactory.create(user=users[1], course_id=courses[0].id, role=CourseStaffRole.ROLE)
+
+        courses_uri = '{}{}/courses/'.format(self.base_organizations_uri, organization['id'])
+        response = self.do_get(courses_uri, query_parameters={'exclude_admins': 'true'})
+        self.assertEqual(response.status_code, 200)
+        enrolled_users = {course['id']: sorted(course['enrolled_users']) for course in response.data}
+        # the staff of one course is still a participant of the other one
+        self.assertEqual(enrolled_users, {
+            unicode(courses[0].id): [users[0].id],
+            unicode(courses[1].id): sorted(user.id for user in users),
+        })
+        self.assertEqual(self.get_query_count(
+            courses_uri, query_parameters={'exclude_admins': 'true'}, models=[CourseEnrollment]
+        ), 1)
+
     def test_organizations_courses_get_organization_user_with_no_course_enrollment(self):
         organization = self.setup_test_organization()
         user = UserFactory.create()
@@ -586,6 +795,27 @@ class OrganizationsApiTests(ModuleStoreTestCase, APIClientMixin):
         self.assertEqual(response.data[1]['id'], self.test_user2.id)
         self.assertEqual(response.data[1]['course_count'], 1)
 
+    def test_organizations_users_get_course_counts_query_count(self):
+        users = UserFactory.create_batch(3)
+        organization = self.setup_test_organization(org_data={'users': [user.id for user in users]})
+        for user in users:
+            CourseEnrollmentFactory.create(user=user, course_id=self.course.id)
+        CourseEnrollmentFactory.create(user=users[0], course_id=self.second_course.id)
+
+        # enrollments are not counted when only user ids are returned
+        users_uri = '{}{}/users/'.format(self.base_organizations_uri, organization['id'])
+        params = {'include_course_counts': 'true', 'view': 'ids'}
+        self.assertEqual(self.get_query_count(users_uri, params, [CourseEnrollment]), 0)
+
+        params = {'include_course_counts': 'true'}
+        self.assertEqual(self.get_query_count(users_uri, params, [CourseEnrollment]), 1)
+        params = {'include_course_counts': 'true', 'page_size': 2}
+        self.assertEqual(self.get_query_count(users_uri, params, [CourseEnrollment]), 1)
+
+        response = self.do_get(users_uri, query_parameters=params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([user_data['course_count'] for user_data in response.data['results']], [2, 1])
+
     def test_organizations_users_get_with_grades(self):
         # Create 4 users
         user_course = 4
@@ -618,6 +848,114 @@ class OrganizationsApiTests(ModuleStoreTestCase, APIClientMixin):
         self.assertEqual(grade_sum, 0.75 + 0.75 + 0.9 + 0.9)
         self.assertEqual(proforma_grade_sum, 0.85 + 0.85 + 0.91 + 0.91)
 
+    def test_organizations_users_get_with_attributes(self):
+        organization = self.setup_test_organization(org_data={'users': [self.test_user.id, self.test_user2.id]})
+        org = Organization.objects.get(id=organization['id'])
+        org.add_attribute('phone')
+        org.add_attribute('address')
+        OrganizationUsersAttributes.bulk_upsert(org, [
+            (self.test_user.id, 'phone_1', '1234'),
+            (self.test_user.id, 'address_2', 'Boston'),
+            (self.test_user2.id, 'phone_1', '5678'),
+        ])
+        org.deactivate_attribute('address_2')
+
+        users_uri = '{}{}/users/'.format(self.base_organizations_uri, organization['id'])
+        response = self.do_get(users_uri, query_parameters={'include_attributes': 'true'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['id'], self.test_user.id)
+        self.assertEqual(response.data[0]['organization_attributes'], {'phone_1': '1234'})
+        self.assertEqual(response.data[1]['id'], self.test_user2.id)
+        self.assertEqual(response.data[1]['organization_attributes'], {'phone_1': '5678'})
+
+        response = self.do_get(users_uri)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('organization_attributes', response.data[0])
+
+    def test_organizations_users_get_query_count(self):
+        users = UserFactory.create_batch(2)
+        organization = self.setup_test_organization(org_data={'users': [user.id for user in users]})
+        for user in users:
+            CourseEnrollmentFactory.create(user=user, course_id=self.course.id)
+            StudentGradebook.objects.create(user=user, course_id=self.course.id, grade=0.8, proforma_grade=0.9)
+
+        users_uri = '{}{}/users/'.format(self.base_organizations_uri, organization['id'])
+        params = {
+            'course_id': unicode(self.course.id),
+            'include_grades': 'true',
+            'include_course_counts': 'true',
+            'include_attributes': 'true',
+        }
+        models = [StudentGradebook, CourseEnrollment, OrganizationUsersAttributes]
+        query_count = self.get_query_count(users_uri, params, models)
+
+        # number of queries does not grow with the number of organization users
+        more_users = UserFactory.create_batch(3)
+        for user in more_users:
+            user.organizations.add(organization['id'])
+            CourseEnrollmentFactory.create(user=user, course_id=self.course.id)
+        self.assertEqual(self.get_query_count(users_uri, params, models), query_count)
+
+    def test_organizations_users_get_paginated(self):
+        users = UserFactory.create_batch(5)
+        organization = self.setup_test_organization(org_data={'users': [user.id for user in users]})
+        for user in users:
+            CourseEnrollmentFactory.create(user=user, course_id=self.course.id)
+            StudentGradebook.objects.create(user=user, course_id=self.course.id, grade=0.8, proforma_grade=0.9)
+        CourseEnrollmentFactory.create(user=users[0], course_id=self.second_course.id)
+
+        users_uri = '{}{}/users/'.format(self.base_organizations_uri, organization['id'])
+        params = {
+            'page_size': 2,
+            'course_id': unicode(self.course.id),
+            'include_grades': 'true',
+            'include_course_counts': 'true',
+        }
+        user_ids = []
+        course_counts = []
+        while True:
+            response = self.do_get(users_uri, query_parameters=params)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 2)
+            for user_data in response.data['results']:
+                self.assertEqual(user_data['grade'], 0.8)
+                user_ids.append(user_data['id'])
+                course_counts.append(user_data['course_count'])
+            if not response.data['next']:
+                break
+            params['cursor'] = parse_qs(urlparse(response.data['next']).query)['cursor'][0]
+        self.assertEqual(user_ids, sorted(user.id for user in users))
+        self.assertEqual(course_counts, [2, 1, 1, 1, 1])
+
+        response = self.do_get(users_uri, query_parameters={'page_size': 'invalid'})
+        self.assertEqual(response.status_code, 400)
+        response = self.do_get(users_uri, query_parameters={'page_size': 0})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(ORGANIZATION_USERS_EXPORT_CHUNK_SIZE=2)
+    def test_organizations_users_get_stream(self):
+        users = UserFactory.create_batch(5)
+        organization = self.setup_test_organization(org_data={'users': [user.id for user in users]})
+        for user in users:
+            CourseEnrollmentFactory.create(user=user, course_id=self.course.id)
+            StudentGradebook.objects.create(user=user, course_id=self.course.id, grade=0.8, proforma_grade=0.9)
+        CourseEnrollmentFactory.create(user=users[0], course_id=self.second_course.id)
+
+        users_uri = '{}{}/users/'.format(self.base_organizations_uri, organization['id'])
+        response = self.do_get(users_uri, query_parameters={
+            'stream': 'true',
+            'course_id': unicode(self.course.id),
+            'include_grades': 'true',
+            'include_course_counts': 'true',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = ''.join(response.streaming_content).splitlines()
+        users_data = [json.loads(line) for line in lines]
+        self.assertEqual([user_data['id'] for user_data in users_data], sorted(user.id for user in users))
+        self.assertEqual([user_data['course_count'] for user_data in users_data], [2, 1, 1, 1, 1])
+        self.assertTrue(all(user_data['grade'] == 0.8 for user_data in users_data))
+
     def test_organizations_users_delete(self):
         """
         Tests organization user link removal API works as expected if given user ids are valid
@@ -696,6 +1034,77 @@ class OrganizationsApiTests(ModuleStoreTestCase, APIClientMixin):
         response = self.do_delete(users_uri, data={})
         self.assertEqual(response.status_code, 400)
 
+    @override_settings(ORGANIZATION_COURSES_ROLLUP_ENABLED=True)
+    @mock.patch('django.db.transaction.on_commit', side_effect=lambda func: func())
+    def test_organizations_courses_rollup(self, on_commit):  # pylint: disable=unused-argument
+        users = UserFactory.create_batch(3)
+        organization = self.setup_test_organization(org_data={'users': [user.id for user in users[:2]]})
+        CourseOverview.get_from_id(self.course.id)
+        CourseOverview.get_from_id(self.second_course.id)
+        for user in users:
+            CourseEnrollmentFactory.create(user=user, course_id=self.course.id)
+        StudentGradebook.objects.create(user=users[0], course_id=self.course.id, grade=0.8, proforma_grade=0.8)
+        StudentGradebook.objects.create(user=users[1], course_id=self.course.id, grade=0.4, proforma_grade=0.9)
+
+        def get_organization_course(course_key):
+            return OrganizationCourse.objects.get(organization=organization['id'], course_id=course_key)
+
+        organization_course = get_organization_course(self.course.id)
+        self.assertEqual(organization_course.enrolled_count, 2)
+        self.assertEqual(organization_course.participant_count, 2)
+        self.assertEqual(organization_course.learner_count, 2)
+        self.assertEqual(organization_course.completed_count, 1)
+        self.assertAlmostEqual(organization_course.grade_average, 0.6)
+
+        # observers are enrolled but are neither participants nor learners
+        CourseAccessRoleFactory.create(user=users[1], course_id=self.course.id, role=CourseObserverRole.ROLE)
+        organization_course = get_organization_course(self.course.id)
+        self.assertEqual(organization_course.enrolled_count, 2)
+        self.assertEqual(organization_course.participant_count, 1)
+        self.assertEqual(organization_course.learner_count, 1)
+        self.assertAlmostEqual(organization_course.grade_average, 0.8)
+
+        metrics_uri = '{}{}/metrics/'.format(self.base_organizations_uri, organization['id'])
+        response = self.do_get(metrics_uri, query_parameters={'courses': unicode(self.course.id)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'users_grade_average': 0.8, 'users_grade_complete_count': 1})
+
+        # membership changes refresh the courses of joining users
+        response = self.do_post('{}{}/users/'.format(self.base_organizations_uri, organization['id']), {
+            'id': users[2].id
+        })
+        self.assertEqual(response.status_code, 201)
+        enrollment = CourseEnrollmentFactory.create(user=users[2], course_id=self.second_course.id)
+        self.assertEqual(get_organization_course(self.course.id).enrolled_count, 3)
+        self.assertEqual(get_organization_course(self.second_course.id).enrolled_count, 1)
+
+        response = self.do_get(self.base_organizations_uri, query_parameters={'ids': organization['id']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['number_of_courses'], 2)
+        self.assertEqual(response.data['results'][0]['number_of_participants'], 3)
+
+        courses_uri = '{}{}/courses/'.format(self.base_organizations_uri, organization['id'])
+        response = self.do_get(courses_uri, query_parameters={'count_enrolled_users': 'true', 'exclude_admins': 'true'})
+        self.assertEqual(response.status_code, 200)
+        enrolled_users_count = {course['id']: course['enrolled_users_count'] for course in response.data}
+        self.assertEqual(enrolled_users_count, {unicode(self.course.id): 2, unicode(self.second_course.id): 1})
+
+        # a course is kept while another member is enrolled in it
+        Organization.objects.get(id=organization['id']).users.remove(users[0])
+        self.assertEqual(get_organization_course(self.course.id).enrolled_count, 2)
+
+        enrollment.delete()
+        self.assertFalse(
+            OrganizationCourse.objects.filter(organization=organization['id'], course_id=self.second_course.id).exists()
+        )
+        self.assertEqual(OrganizationStats.objects.get(organization=organization['id']).course_count, 1)
+
+        users[2].organizations.clear()
+        users[1].organizations.clear()
+        self.assertFalse(OrganizationCourse.objects.filter(organization=organization['id']).exists())
+        stats = OrganizationStats.objects.get(organization=organization['id'])
+        self.assertEqual((stats.member_count, stats.course_count), (0, 0))
+
     def test_organizations_metrics_get(self):
         users = []
         for i in xrange(1, 6):
@@ -728,6 +1137,98 @@ class OrganizationsApiTests(ModuleStoreTestCase, APIClientMixin):
         self.assertEqual(response.data['users_grade_average'], 0.838)
         self.assertEqual(response.data['users_grade_complete_count'], 4)
 
+    def test_organizations_metrics_get_query_count(self):
+        users = UserFactory.create_batch(3)
+        for user in users:
+            CourseEnrollmentFactory.create(user=user, course_id=self.course.id)
+            StudentGradebook.objects.create(user=user, course_id=self.course.id, grade=0.8, proforma_grade=0.8)
+        organization = self.setup_test_organization(org_data={'users': [user.id for user in users]})
+
+        metrics_uri = '{}{}/metrics/'.format(self.base_organizations_uri, organization['id'])
+        models = [StudentGradebook, CourseEnrollment]
+        # one query for grades and complete count, one for enrolled users and courses
+        self.assertEqual(self.get_query_count(metrics_uri, models=models), 2)
+        self.assertEqual(
+            self.get_query_count(metrics_uri, query_parameters={'courses': unicode(self.course.id)}, models=models), 2
+        )
+
+    def test_organizations_metrics_get_excluded_users(self):
+        users = UserFactory.create_batch(3)
+        for user in users:
+            CourseEnrollmentFactory.create(user=user, course_id=self.course.id)
+        StudentGradebook.objects.create(user=users[0], course_id=self.course.id, grade=0.2, proforma_grade=0.9)
+        for user in users[1:]:
+            StudentGradebook.objects.create(user=user, course_id=self.course.id, grade=0.8, proforma_grade=0.8)
+        CourseAccessRoleFactory.create(user=users[0], course_id=self.course.id, role=CourseObserverRole.ROLE)
+        organization = self.setup_test_organization(org_data={'users': [user.id for user in users]})
+
+        metrics_uri = '{}{}/metrics/'.format(self.base_organizations_uri, organization['id'])
+        response = self.do_get(metrics_uri)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['users_grade_average'], 0.6)
+        self.assertEqual(response.data['users_grade_complete_count'], 2)
+
+        # observers of the filtered courses are left out of the aggregates
+        response = self.do_get(metrics_uri, query_parameters={
+            'courses': '{},{}'.format(self.course.id, self.second_course.id)
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['users_grade_average'], 0.4)
+        self.assertEqual(response.data['users_grade_complete_count'], 2)
+
+    def test_organizations_metrics_get_cached(self):
+        users = UserFactory.create_batch(2)
+        for user in users:
+            CourseEnrollmentFactory.create(user=user, course_id=self.course.id)
+        gradebook = StudentGradebook.objects.create(
+            user=users[0], course_id=self.course.id, grade=0.8, proforma_grade=0.8
+        )
+        organization = self.setup_test_organization(org_data={'users': [user.id for user in users]})
+
+        metrics_uri = '{}{}/metrics/'.format(self.base_organizations_uri, organization['id'])
+        models = [StudentGradebook, CourseEnrollment]
+        metrics_cache.reset_stats()
+        self.assertEqual(self.get_query_count(metrics_uri, models=models), 2)
+        self.assertEqual(self.get_query_count(metrics_uri, models=models), 0)
+        self.assertEqual(metrics_cache.stats(), {'hits': 1, 'misses': 1})
+        response = self.do_get(metrics_uri)
+        self.assertEqual(response.data['users_grade_average'], 0.4)
+        self.assertEqual(response.data['users_grade_complete_count'], 1)
+
+        # gradebook changes invalidate the organizations of the user
+        gradebook.grade = 0.6
+        gradebook.save()
+        response = self.do_get(metrics_uri)
+        self.assertEqual(response.data['users_grade_average'], 0.3)
+        self.assertEqual(response.data['users_grade_complete_count'], 0)
+
+        # and so do membership changes
+        response = self.do_delete('{}{}/users/'.format(self.base_organizations_uri, organization['id']), data={
+            'users': str(users[1].id)
+        })
+        self.assertEqual(response.status_code, 200)
+        response = self.do_get(metrics_uri)
+        self.assertEqual(response.data['users_grade_average'], 0.6)
+
+    def test_organizations_metrics_invalidated_while_computing(self):
+        organization = self.setup_test_organization()
+        metrics_uri = '{}{}/metrics/'.format(self.base_organizations_uri, organization['id'])
+        stale_metrics = {'users_grade_average': 0.9, 'users_grade_complete_count': 9}
+
+        def get_stale_metrics(pk, courses):  # pylint: disable=unused-argument
+            # a write commits while the previous data is being aggregated
+            metrics_cache.invalidate(pk)
+            return stale_metrics
+
+        with mock.patch('edx_solutions_organizations.views.OrganizationsViewSet._get_metrics',
+                        side_effect=get_stale_metrics):
+            response = self.do_get(metrics_uri)
+        self.assertEqual(response.data, stale_metrics)
+
+        # the stale result was stored under the dropped generation
+        response = self.do_get(metrics_uri)
+        self.assertEqual(response.data, {'users_grade_average': 0, 'users_grade_complete_count': 0})
+
     @ddt.data(ModuleStoreEnum.Type.split, ModuleStoreEnum.Type.mongo)
     def test_organizations_metrics_get_courses_filter(self, store):
         users = []
@@ -1022,6 +1523,18 @@ class OrganizationsAttributesApiTests(ModuleStoreTestCase, APIClientMixin):
         response = self.do_post(test_uri, data)
         self.assertEqual(response.status_code, 409)
 
+    def test_organizations_attributes_add_invalid_name(self):
+        organization = self.setup_test_organization()
+
+        test_uri = '{}{}/attributes'.format(self.base_organizations_uri, organization['id'])
+        for data in ({}, {'name': ''}, {'name': ['phone']}, {'name': 'p' * 300}, {'name': 'p' * 254}):
+            response = self.do_post(test_uri, data)
+            self.assertEqual(response.status_code, 400)
+
+        response = self.do_get(test_uri)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [])
+
     def test_organizations_attributes_get(self):
         organization = self.setup_test_organization()
 
@@ -1046,6 +1559,226 @@ class OrganizationsAttributesApiTests(ModuleStoreTestCase, APIClientMixin):
 
         self.assertEqual(response.data, expected_response)
 
+    def test_organizations_attributes_add_previously_deleted(self):
+        organization = self.setup_test_organization()
+
+        test_uri = '{}{}/attributes'.format(self.base_organizations_uri, organization['id'])
+        response = self.do_post(test_uri, {'name': 'phone'})
+        self.assertEqual(response.status_code, 201)
+        response = self.do_delete(test_uri, {'key': 'phone_1'})
+        self.assertEqual(response.status_code, 200)
+
+        # adding the label again reactivates the existing attribute
+        response = self.do_post(test_uri, {'name': 'phone'})
+        self.assertEqual(response.status_code, 201)
+        response = self.do_get(test_uri)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [{'order': 1, 'label': 'phone', 'key': 'phone_1'}])
+
+    def test_organizations_attributes_batch(self):
+        organization = self.setup_test_organization()
+
+        test_uri = '{}{}/attributes/batch'.format(self.base_organizations_uri, organization['id'])
+        data = {
+            'operations': [
+                {'action': 'create', 'name': 'phone'},
+                {'action': 'create', 'name': 'address'},
+                {'action': 'create', 'name': 'email'},
+                {'action': 'rename', 'key': 'phone_1', 'name': 'cell'},
+                {'action': 'deactivate', 'key': 'email_3'},
+            ]
+        }
+        response = self.do_post(test_uri, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.data['results']], [201, 201, 201, 200, 200])
+        self.assertEqual([result['key'] for result in response.data['results']], [
+            'phone_1', 'address_2', 'email_3', 'phone_1', 'email_3'
+        ])
+
+        response = self.do_get('{}{}/attributes'.format(self.base_organizations_uri, organization['id']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(response.data, key=lambda attribute: attribute['order']),
+            [{'order': 1, 'label': 'cell', 'key': 'phone_1'}, {'order': 2, 'label': 'address', 'key': 'address_2'}]
+        )
+
+        # labels are checked against the resulting set, so labels can be swapped
+        data = {
+            'operations': [
+                {'action': 'rename', 'key': 'phone_1', 'name': 'address'},
+                {'action': 'rename', 'key': 'address_2', 'name': 'cell'},
+            ]
+        }
+        response = self.do_post(test_uri, data)
+        self.assertEqual(response.status_code, 200)
+        response = self.do_get('{}{}/attributes'.format(self.base_organizations_uri, organization['id']))
+        self.assertEqual(
+            sorted(response.data, key=lambda attribute: attribute['order']),
+            [{'order': 1, 'label': 'address', 'key': 'phone_1'}, {'order': 2, 'label': 'cell', 'key': 'address_2'}]
+        )
+
+    def test_organizations_attributes_batch_invalid(self):
+        organization = self.setup_test_organization()
+
+        test_uri = '{}{}/attributes/batch'.format(self.base_organizations_uri, organization['id'])
+        response = self.do_post(test_uri, {'operations': []})
+        self.assertEqual(response.status_code, 400)
+
+        data = {
+            'operations': [
+                {'action': 'create', 'name': 'phone'},
+                {'action': 'create', 'name': 'address'},
+                {'action': 'rename', 'key': 'address_2', 'name': 'phone'},
+                {'action': 'deactivate', 'key': 'mobile'},
+                {'action': 'drop', 'key': 'phone_1'},
+                {'action': 'rename', 'key': ['phone_1'], 'name': 'mobile'},
+                {'action': 'deactivate', 'key': {'phone_1': True}},
+                {'action': 'create', 'name': 'p' * 254},
+                {'action': 'rename', 'key': 'address_2', 'name': 'p' * 300},
+            ]
+        }
+        response = self.do_post(test_uri, data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']], [409, 201, 409, 404, 400, 400, 400, 400, 400]
+        )
+
+        # nothing is applied when any of the operations is invalid
+        response = self.do_get('{}{}/attributes'.format(self.base_organizations_uri, organization['id']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [])
+
+    def test_organizations_users_attributes_bulk_upsert(self):
+        organization = self.setup_test_organization()
+        users = UserFactory.create_batch(3)
+
+        response = self.do_post('{}{}/attributes'.format(self.base_organizations_uri, organization['id']), {
+            'name': 'phone'
+        })
+        self.assertEqual(response.status_code, 201)
+
+        test_uri = '{}{}/users/attributes'.format(self.base_organizations_uri, organization['id'])
+        data = {
+            'attributes': [{'user_id': user.id, 'key': 'phone_1', 'value': str(user.id)} for user in users]
+        }
+        response = self.do_post(test_uri, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'created': 3, 'updated': 0})
+
+        data = {
+            'attributes': [
+                {'user_id': users[0].id, 'key': 'phone_1', 'value': 'changed'},
+                {'user_id': users[1].id, 'key': 'phone_1', 'value': str(users[1].id)},
+            ]
+        }
+        response = self.do_post(test_uri, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'created': 0, 'updated': 1})
+        self.assertEqual(OrganizationUsersAttributes.get_value(users[0], 'phone_1'), 'changed')
+        self.assertEqual(OrganizationUsersAttributes.get_value(users[2], 'phone_1'), str(users[2].id))
+
+    def test_organizations_users_attributes_bulk_upsert_invalid(self):
+        organization = self.setup_test_organization()
+        user = UserFactory.create()
+
+        test_uri = '{}{}/users/attributes'.format(self.base_organizations_uri, organization['id'])
+        response = self.do_post(test_uri, {'attributes': [{'user_id': user.id, 'key': 'phone_1'}]})
+        self.assertEqual(response.status_code, 400)
+
+        # key is not an attribute of the organization
+        data = {'attributes': [{'user_id': user.id, 'key': 'phone_1', 'value': '1234'}]}
+        response = self.do_post(test_uri, data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(OrganizationUsersAttributes.objects.filter(user=user).count(), 0)
+
+        response = self.do_post('{}{}/attributes'.format(self.base_organizations_uri, organization['id']), {
+            'name': 'phone'
+        })
+        self.assertEqual(response.status_code, 201)
+        response = self.do_post(test_uri, {'attributes': [{'user_id': user.id, 'key': ['phone_1'], 'value': '1234'}]})
+        self.assertEqual(response.status_code, 400)
+
+        with mock.patch.object(OrganizationUsersAttributes.objects, 'bulk_create', side_effect=IntegrityError):
+            response = self.do_post(test_uri, {'attributes': [{'user_id': user.id, 'key': 'phone_1', 'value': '1'}]})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(OrganizationUsersAttributes.objects.filter(user=user).count(), 0)
+
+        test_uri = '{}{}/users/attributes'.format(self.base_organizations_uri, 123456)
+        response = self.do_post(test_uri, data)
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(ORGANIZATION_USERS_EXPORT_CHUNK_SIZE=2)
+    def test_organizations_users_export(self):
+        users = UserFactory.create_batch(3)
+        organization = self.setup_test_organization(org_data={'users': [user.id for user in users]})
+        response = self.do_post('{}{}/attributes'.format(self.base_organizations_uri, organization['id']), {
+            'name': 'phone'
+        })
+        self.assertEqual(response.status_code, 201)
+        OrganizationUsersAttributes.bulk_upsert(
+            Organization.objects.get(id=organization['id']), [(users[0].id, 'phone_1', '1234')]
+        )
+        # the value of another organization under the same key is not exported
+        other_organization = Organization.objects.create(name='Other Org')
+        other_organization.add_attribute('phone')
+        OrganizationUsersAttributes.bulk_upsert(other_organization, [(users[1].id, 'phone_1', '5678')])
+        for user in users[:2]:
+            CourseEnrollmentFactory.create(user=user, course_id=self.course.id)
+        StudentGradebook.objects.create(user=users[0], course_id=self.course.id, grade=0.8, proforma_grade=0.7)
+
+        test_uri = '{}{}/users/export'.format(self.base_organizations_uri, organization['id'])
+        response = self.do_get(test_uri)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(''.join(response.streaming_content).splitlines()))
+        course_id = unicode(self.course.id)
+        self.assertEqual(rows[0], [
+            'id', 'username', 'email', 'first_name', 'last_name',
+            '{} grade'.format(course_id), '{} proforma_grade'.format(course_id),
+            '{} complete_status'.format(course_id), 'phone',
+        ])
+        self.assertEqual([int(row[0]) for row in rows[1:]], sorted(user.id for user in users))
+        self.assertEqual(rows[1][5:], ['0.8', '0.7', 'True', '1234'])
+        self.assertEqual(rows[2][5:], ['', '', '', ''])
+
+        response = self.do_get(test_uri, query_parameters={'course_id': unicode(self.second_course.id)})
+        self.assertEqual(response.status_code, 200)
+        rows = list(csv.reader(''.join(response.streaming_content).splitlines()))
+        self.assertEqual(rows[0][5], '{} grade'.format(unicode(self.second_course.id)))
+        self.assertEqual(rows[1][5:], ['', '', '', '1234'])
+
+        response = self.do_get('{}{}/users/export'.format(self.base_organizations_uri, 123456))
+        self.assertEqual(response.status_code, 404)
+
+    def test_organizations_attributes_get_cached(self):
+        organization = self.setup_test_organization()
+
+        test_uri = '{}{}/attributes'.format(self.base_organizations_uri, organization['id'])
+        response = self.do_post(test_uri, {'name': 'phone'})
+        self.assertEqual(response.status_code, 201)
+
+        attribute_schema_cache.clear()
+        response = self.do_get(test_uri)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(attribute_schema_cache.stats()['misses'], 1)
+
+        response = self.do_get(test_uri)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(attribute_schema_cache.stats()['hits'], 1)
+        self.assertEqual(response.data, [{'order': 1, 'label': 'phone', 'key': 'phone_1'}])
+
+        # writes invalidate the cached schema
+        response = self.do_put(test_uri, {'name': 'cell', 'key': 'phone_1'})
+        self.assertEqual(response.status_code, 200)
+        response = self.do_get(test_uri)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [{'order': 1, 'label': 'cell', 'key': 'phone_1'}])
+
+    def test_organizations_attributes_get_invalid_organization(self):
+        test_uri = '{}{}/attributes'.format(self.base_organizations_uri, 123456)
+        response = self.do_get(test_uri)
+        self.assertEqual(response.status_code, 404)
+
     def test_organizations_attributes_update(self):
         organization = self.setup_test_organization()
 
@@ -1141,6 +1874,35 @@ class OrganizationsAttributesApiTests(ModuleStoreTestCase, APIClientMixin):
         response = self.do_put(test_uri, data)
         self.assertEqual(response.status_code, 404)
 
+    def test_organizations_attributes_update_without_name(self):
+        organization = self.setup_test_organization()
+
+        test_uri = '{}{}/attributes'.format(self.base_organizations_uri, organization['id'])
+        response = self.do_post(test_uri, {'name': 'phone'})
+        self.assertEqual(response.status_code, 201)
+
+        for data in ({'key': 'phone_1'}, {'key': 'phone_1', 'name': ''}, {'key': 'phone_1', 'name': ['mobile']}):
+            response = self.do_put(test_uri, data)
+            self.assertEqual(response.status_code, 400)
+
+        response = self.do_get(test_uri)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([attribute['label'] for attribute in response.data], ['phone'])
+
+    def test_organizations_attributes_update_with_long_name(self):
+        organization = self.setup_test_organization()
+
+        test_uri = '{}{}/attributes'.format(self.base_organizations_uri, organization['id'])
+        response = self.do_post(test_uri, {'name': 'phone'})
+        self.assertEqual(response.status_code, 201)
+
+        response = self.do_put(test_uri, {'key': 'phone_1', 'name': 'p' * 300})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.do_get(test_uri)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([attribute['label'] for attribute in response.data], ['phone'])
+
     def test_organizations_attributes_delete_with_key(self):
         organization = self.setup_test_organization()
 
@@ -1204,3 +1966,291 @@ class OrganizationsAttributesApiTests(ModuleStoreTestCase, APIClientMixin):
         self.assertEqual(response.status_code, 404)
 
 
+class OrganizationAttributeSchemaTests(TestCase):
+    """ Test suite for the attribute schema on Organization """
+
+    def setUp(self):
+        super(OrganizationAttributeSchemaTests, self).setUp()
+        self.organization = Organization.objects.create(name=str(uuid.uuid4()))
+        OrganizationAttribute.objects.create(organization=self.organization, key='phone_1', label='phone', order=1)
+        OrganizationAttribute.objects.create(
+            organization=self.organization, key='address_2', label='address', order=2, is_active=False
+        )
+        attribute_schema_cache.clear()
+
+    def test_attributes_loaded_once(self):
+        organization = Organization.objects.get(id=self.organization.id)
+        with self.assertNumQueries(1):
+            self.assertTrue(organization.is_attribute_exists('phone'))
+            self.assertFalse(organization.is_attribute_exists('address'))
+            self.assertTrue(organization.is_key_exists('phone_1'))
+            self.assertFalse(organization.is_key_exists('address_2'))
+            self.assertEqual(organization.get_all_attribute_keys(), ['phone_1'])
+            self.assertEqual(
+                organization.get_all_attributes(),
+                [{'key': 'phone_1', 'label': 'phone', 'order': 1}]
+            )
+
+        # another instance of the same version is served from the cross-request cache
+        organization = Organization.objects.get(id=self.organization.id)
+        with self.assertNumQueries(0):
+            self.assertTrue(organization.is_key_exists('phone_1'))
+
+    def test_schema_invalidated_on_write(self):
+        self.assertFalse(self.organization.is_key_exists('address_2'))
+        key = self.organization.add_attribute('address')
+        self.assertEqual(key, 'address_2')
+        self.assertTrue(self.organization.is_key_exists('address_2'))
+
+        key = self.organization.add_attribute('email')
+        self.assertEqual(key, 'email_3')
+        self.assertEqual(self.organization.attribute_schema.max_order, 3)
+
+        self.organization.rename_attribute('phone_1', 'cell')
+        self.assertTrue(self.organization.is_attribute_exists('cell'))
+        self.assertFalse(self.organization.is_attribute_exists('phone'))
+
+        self.organization.deactivate_attribute('phone_1')
+        self.assertFalse(self.organization.is_key_exists('phone_1'))
+
+        # a fresh instance sees the same state
+        organization = Organization.objects.get(id=self.organization.id)
+        self.assertEqual(set(organization.get_all_attribute_keys()), {'address_2', 'email_3'})
+
+
+class OrganizationUsersAttributesTests(TestCase):
+    """ Test suite for the OrganizationUsersAttributes model """
+
+    def setUp(self):
+        super(OrganizationUsersAttributesTests, self).setUp()
+        self.organization = Organization.objects.create(name=str(uuid.uuid4()))
+        self.organization.add_attribute('phone')
+        self.organization.add_attribute('address')
+        self.users = UserFactory.create_batch(3)
+
+    def test_bulk_upsert_in_batches(self):
+        rows = [(user.id, 'phone_1', 'phone {}'.format(user.id)) for user in self.users]
+        rows.append((self.users[0].id, 'address_2', 'Boston'))
+        with self.assertNumQueries(11):
+            created, updated = OrganizationUsersAttributes.bulk_upsert(self.organization, rows, batch_size=2)
+        self.assertEqual((created, updated), (4, 0))
+
+        rows = [(self.users[0].id, 'address_2', 'NYC'), (self.users[1].id, 'address_2', 'Boston')]
+        created, updated = OrganizationUsersAttributes.bulk_upsert(self.organization, rows)
+        self.assertEqual((created, updated), (1, 1))
+        self.assertEqual(OrganizationUsersAttributes.get_value(self.users[0], 'address_2'), 'NYC')
+        self.assertEqual(OrganizationUsersAttributes.get_value(self.users[1], 'address_2'), 'Boston')
+        self.assertEqual(OrganizationUsersAttributes.objects.count(), 5)
+
+    def test_bulk_upsert_invalid_rows(self):
+        rows = [
+            (self.users[0].id, 'phone_1', '1234'),
+            (self.users[1].id, 'email_3', 'user@example.com'),
+            (123456, 'phone_1', '1234'),
+            ('invalid', 'phone_1', '1234'),
+        ]
+        with self.assertRaises(ValidationError) as context:
+            OrganizationUsersAttributes.bulk_upsert(self.organization, rows)
+        self.assertEqual(len(context.exception.messages), 3)
+        self.assertEqual(OrganizationUsersAttributes.objects.count(), 0)
+
+    def test_bulk_upsert_value_of_other_organization(self):
+        other_organization = Organization.objects.create(name=str(uuid.uuid4()))
+        other_organization.add_attribute('phone')
+        OrganizationUsersAttributes.bulk_upsert(other_organization, [(self.users[0].id, 'phone_1', '1234')])
+
+        rows = [(self.users[0].id, 'phone_1', '5678'), (self.users[1].id, 'phone_1', '9012')]
+        with self.assertRaises(ValidationError) as context:
+            OrganizationUsersAttributes.bulk_upsert(self.organization, rows)
+        self.assertEqual(len(context.exception.messages), 1)
+
+        value = OrganizationUsersAttributes.objects.get(user=self.users[0], key='phone_1')
+        self.assertEqual(value.organization_id, other_organization.id)
+        self.assertEqual(value.value, '1234')
+        self.assertFalse(OrganizationUsersAttributes.objects.filter(organization=self.organization).exists())
+
+    def test_get_values(self):
+        OrganizationUsersAttributes.bulk_upsert(self.organization, [
+            (self.users[0].id, 'phone_1', '1234'),
+            (self.users[0].id, 'address_2', 'Boston'),
+            (self.users[1].id, 'phone_1', '5678'),
+        ])
+        expected = {
+            self.users[0].id: {'phone_1': '1234', 'address_2': 'Boston'},
+            self.users[1].id: {'phone_1': '5678', 'address_2': ''},
+            self.users[2].id: {'phone_1': '', 'address_2': ''},
+        }
+        with self.assertNumQueries(1):
+            values = OrganizationUsersAttributes.get_values(self.users, ['phone_1', 'address_2'], default='')
+        self.assertEqual(values, expected)
+
+        with self.assertNumQueries(3):
+            values = OrganizationUsersAttributes.get_values(
+                User.objects.filter(id__in=[user.id for user in self.users]), ['phone_1', 'address_2'],
+                default='', batch_size=2
+            )
+        self.assertEqual(values, expected)
+
+    def test_get_values_of_organization(self):
+        other_organization = Organization.objects.create(name=str(uuid.uuid4()))
+        other_organization.add_attribute('phone')
+        OrganizationUsersAttributes.bulk_upsert(other_organization, [(self.users[0].id, 'phone_1', '1234')])
+
+        values = OrganizationUsersAttributes.get_values(
+            self.users[:1], ['phone_1'], default='', organization=self.organization
+        )
+        self.assertEqual(values, {self.users[0].id: {'phone_1': ''}})
+        values = OrganizationUsersAttributes.get_values(
+            self.users[:1], ['phone_1'], default='', organization=other_organization
+        )
+        self.assertEqual(values, {self.users[0].id: {'phone_1': '1234'}})
+
+    def test_get_all_users_by_organization_attribute_filter(self):
+        OrganizationUsersAttributes.bulk_upsert(self.organization, [
+            (self.users[0].id, 'phone_1', '1'),
+            (self.users[0].id, 'address_2', 'Boston'),
+            (self.users[1].id, 'phone_1', '1'),
+            (self.users[1].id, 'address_2', 'NYC'),
+            (self.users[2].id, 'phone_1', '2'),
+            (self.users[2].id, 'address_2', 'Boston'),
+        ])
+        users = User.objects.filter(id__in=[user.id for user in self.users]).order_by('id')
+
+        def filter_user_ids(attribute_keys, attribute_values):
+            """ Returns ids of the users matching the given attribute filter """
+            return list(Organization.get_all_users_by_organization_attribute_filter(
+                users, [self.organization], attribute_keys, attribute_values
+            ).values_list('id', flat=True))
+
+        with self.assertNumQueries(2):
+            self.assertEqual(filter_user_ids(['phone_1', 'address_2'], ['1', 'Boston']), [self.users[0].id])
+        self.assertEqual(filter_user_ids(['address_2'], ['Boston']), [self.users[0].id, self.users[2].id])
+
+        # keys which are not active attributes are ignored
+        self.assertEqual(filter_user_ids(['phone_1', 'email_3'], ['1', 'x']), [self.users[0].id, self.users[1].id])
+        self.assertEqual(filter_user_ids(['email_3'], ['x']), [user.id for user in self.users])
+
+        # different values for the same key match nobody
+        self.assertEqual(filter_user_ids(['phone_1', 'phone_1'], ['1', '2']), [])
+
+
+@skipUnless(connection.features.has_select_for_update, 'requires row level locking')
+@mock.patch.object(OrganizationAttributesView, 'permission_classes', ())
+class OrganizationAttributesConcurrencyTests(TransactionTestCase):
+    """ Stress tests for concurrent changes through the Organization Attributes API """
+
+    THREAD_COUNT = 8
+
+    def setUp(self):
+        super(OrganizationAttributesConcurrencyTests, self).setUp()
+        self.organization = Organization.objects.create(name=str(uuid.uuid4()))
+        self.user = UserFactory.create()
+        self.view = OrganizationAttributesView.as_view()
+        self.factory = APIRequestFactory()
+
+    def _request(self, method, data, results):
+        """
+        Calls the attributes view from a worker thread and records the response status
+        """
+        try:
+            uri = '/api/server/organizations/{}/attributes'.format(self.organization.id)
+            request = getattr(self.factory, method)(uri, data, format='json')
+            force_authenticate(request, user=self.user)
+            response = self.view(request, organization_id=str(self.organization.id))
+            results.append(response.status_code)
+        finally:
+            connection.close()
+
+    def _run_concurrently(self, method, payloads):
+        """
+        Fires one thread per payload against the view and returns the response statuses
+        """
+        results = []
+        threads = [threading.Thread(target=self._request, args=(method, data, results)) for data in payloads]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_adds_get_distinct_orders(self):
+        results = self._run_concurrently('post', [{'name': 'field{}'.format(i)} for i in xrange(self.THREAD_COUNT)])
+        self.assertEqual(results, [201] * self.THREAD_COUNT)
+        orders = OrganizationAttribute.objects.filter(organization=self.organization).values_list('order', flat=True)
+        self.assertEqual(sorted(orders), range(1, self.THREAD_COUNT + 1))
+
+    def test_concurrent_adds_of_same_label(self):
+        results = self._run_concurrently('post', [{'name': 'phone'}] * self.THREAD_COUNT)
+        self.assertEqual(sorted(results), [201] + [409] * (self.THREAD_COUNT - 1))
+        self.assertEqual(OrganizationAttribute.objects.filter(organization=self.organization).count(), 1)
+
+    def test_concurrent_renames_to_same_label(self):
+        for i in xrange(self.THREAD_COUNT):
+            self.organization.add_attribute('field{}'.format(i))
+        keys = self.organization.get_all_attribute_keys()
+        results = self._run_concurrently('put', [{'key': key, 'name': 'phone'} for key in keys])
+        self.assertEqual(sorted(results), [200] + [409] * (self.THREAD_COUNT - 1))
+
+    def test_get_during_open_write_does_not_cache_previous_schema(self):
+        attribute_schema_cache.clear()
+        written, checked = threading.Event(), threading.Event()
+
+        def write():
+            try:
+                with transaction.atomic():
+                    Organization.objects.get(id=self.organization.id).add_attribute('phone')
+                    written.set()
+                    checked.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        self.assertTrue(written.wait(10))
+        # the write is not committed yet, so the previous schema is still served
+        self.assertEqual(attribute_schema_cache.get(self.organization.id).active_labels, set())
+        checked.set()
+        thread.join()
+        self.assertEqual(attribute_schema_cache.get(self.organization.id).active_labels, {'phone'})
+
+    def test_concurrent_deletes(self):
+        key = self.organization.add_attribute('phone')
+        results = self._run_concurrently('delete', [{'key': key}] * self.THREAD_COUNT)
+        self.assertEqual(results.count(200), 1)
+        self.assertEqual(len(results), self.THREAD_COUNT)
+        self.assertFalse(Organization.objects.get(id=self.organization.id).is_key_exists(key))
+
+
+class MigrateOrganizationAttributesTests(TestCase):
+    """ Test suite for reading attribute blobs in the 0008_migrate_organization_attributes migration """
+
+    def setUp(self):
+        super(MigrateOrganizationAttributesTests, self).setUp()
+        self.migration = import_module('edx_solutions_organizations.migrations.0008_migrate_organization_attributes')
+
+    def get_definitions(self, attributes):
+        """ Returns migrated definitions of the given attributes blob """
+        return self.migration._get_attribute_definitions(1, json.dumps(attributes))  # pylint: disable=protected-access
+
+    def test_missing_and_duplicate_labels(self):
+        definitions = self.get_definitions({
+            'phone_1': {'label': None, 'order': 1, 'is_active': True},
+            'email_2': {'label': 'email', 'order': 2, 'is_active': False},
+            'email_3': {'label': 'email', 'order': 3, 'is_active': True},
+        })
+        self.assertEqual(definitions, [
+            ('phone_1', 'phone_1', 1, True),
+            ('email_3', 'email', 3, True),
+            ('email_2', 'email (email_2)', 2, False),
+        ])
+
+    def test_long_key_and_label(self):
+        key, label = 'k' * 300, 'l' * 300
+        definitions = self.get_definitions({key: {'label': label, 'order': 1, 'is_active': True}})
+        self.assertEqual(definitions, [(key[:255], label[:255], 1, True)])
+
+    def test_malformed_blob(self):
+        with self.assertRaises(ValueError):
+            self.migration._get_attribute_definitions(1, '{"phone_1": ')  # pylint: disable=protected-access
+        with self.assertRaises(KeyError):
+            self.get_definitions({'phone_1': {'label': 'phone', 'is_active': True}})
@@ -1,4 +1,12 @@
 """ Utility methods for Organization Attributes """
+from django.conf import settings
+from django.db.models import Func, IntegerField
+
+from student.models import CourseAccessRole
+from student.roles import CourseAssistantRole, CourseInstructorRole, CourseObserverRole, CourseStaffRole
+
+# course roles whose holders are not counted as course participants
+COURSE_ADMIN_ROLES = [CourseInstructorRole.ROLE, CourseStaffRole.ROLE, CourseObserverRole.ROLE, CourseAssistantRole.ROLE]
 
 
 def generate_key_for_field(data):
@@ -39,3 +47,109 @@ def is_key_exists(key, data):
     :return: boolean value
     """
     return key in data.keys()
+
+
+def chunks(items, size):
+    """
+    Method used to split a list into consecutive slices
+    :param items: list to split
+    :param size: maximum number of items per slice
+    :return: generator of slices
+    """
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def queryset_chunks(queryset, size):
+    """
+    Method used to read a queryset in consecutive chunks ordered by id. Each chunk
+    is fetched with its own keyset query so prefetches run per chunk as well
+    :param queryset: queryset to read
+    :param size: maximum number of objects per chunk
+    :return: generator of lists of objects
+    """
+    queryset = queryset.order_by('id')
+    last_id = 0
+    while True:
+        chunk = list(queryset.filter(id__gt=last_id)[:size])
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1].id
+
+
+def get_aggregate_exclusion_roles():
+    """
+    Method used to get the course roles whose holders are left out of aggregates
+    :return: list of role names
+    """
+    return getattr(settings, 'AGGREGATION_EXCLUDE_ROLES', [CourseObserverRole.ROLE])
+
+
+def get_aggregate_exclusion_users(course_keys):
+    """
+    Method used to get the users which are left out of aggregates of the given courses
+    :param course_keys: keys of the courses being aggregated
+    :return: queryset of user ids, to be used as a subquery
+    """
+    return CourseAccessRole.objects.filter(
+        course_id__in=course_keys, role__in=get_aggregate_exclusion_roles()
+    ).values('user_id')
+
+
+class SubqueryCount(Func):
+    """
+    COUNT(DISTINCT expression) to be selected as the only value of a correlated
+    subquery. It is not an aggregate to django, so no GROUP BY is added and the
+    subquery returns a single row, 0 when nothing matches.
+    """
+    function = 'COUNT'
+    template = '%(function)s(DISTINCT %(expressions)s)'
+
+    def __init__(self, expression, **extra):
+        super(SubqueryCount, self).__init__(expression, output_field=IntegerField(), **extra)
+
+
+class AttributeSchema(object):
+    """
+    Read-only view of the attributes defined for an organization. Keeps lookup
+    sets so that membership checks do not need to re-scan the definitions.
+    """
+
+    def __init__(self, definitions):
+        """
+        :param definitions: iterable of (key, label, order, is_active) tuples
+        """
+        attributes = {}
+        self.labels = set()
+        self.active_keys = set()
+        self.active_labels = set()
+        self.max_order = 0
+        for key, label, order, is_active in definitions:
+            attributes[key] = {'key': key, 'label': label, 'order': order, 'is_active': is_active}
+            self.labels.add(label)
+            self.max_order = max(self.max_order, order)
+            if is_active:
+                self.active_keys.add(key)
+                self.active_labels.add(label)
+
+        # active attributes keep the key order of the former JSON backed schema
+        self.active_attributes = [
+            {
+                'key': key,
+                'label': value['label'],
+                'order': value['order'],
+            } for key, value in attributes.items() if value['is_active']
+        ]
+
+    def get_active_attributes(self):
+        """
+        Returns a fresh list of active attributes, safe for the caller to modify
+        """
+        return [dict(attribute) for attribute in self.active_attributes]
+
+    def get_active_keys(self):
+        """
+        Returns active attribute keys in the same order as `get_active_attributes`
+        """
+        return [attribute['key'] for attribute in self.active_attributes]
@@ -1,21 +1,26 @@
 # pylint: disable=C0103
 
 """ ORGANIZATIONS API VIEWS """
+import csv
 import json
-from functools import reduce
 from django.conf import settings
 from django.contrib.auth.models import User, Group
-from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Sum, F, Count, Prefetch, Case, When, Q
-from django.db import IntegrityError
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db.models import Sum, F, Count, Prefetch, Case, When, Exists, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db import IntegrityError, transaction
+from django.http import StreamingHttpResponse
+from django.utils import six
+from django.utils.encoding import force_text, smart_str
 from django.utils.translation import ugettext as _
-from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
 from openedx.core.djangoapps.user_api.models import UserPreference
 
 from rest_framework import status
 from rest_framework.decorators import detail_route, list_route
 from rest_framework.response import Response
 from rest_framework.exceptions import ParseError
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import replace_query_param
 
 from edx_solutions_api_integration.courseware_access import get_course_key, get_course_descriptor
 from edx_solutions_api_integration.courses.serializers import OrganizationCourseSerializer
@@ -23,26 +28,28 @@ from edx_solutions_api_integration.users.serializers import SimpleUserSerializer
 from edx_solutions_api_integration.groups.serializers import GroupSerializer
 from edx_solutions_api_integration.permissions import (
     MobileAPIView,
+    SecureAPIView,
     SecureListAPIView,
     SecurePaginatedModelViewSet,
 )
-from edx_solutions_api_integration.utils import (
-    str2bool,
-    get_aggregate_exclusion_user_ids,
-)
+from edx_solutions_api_integration.utils import str2bool
 from gradebook.models import StudentGradebook
 from student.models import CourseEnrollment, CourseAccessRole
-from student.roles import (
-    CourseAssistantRole,
-    CourseInstructorRole,
-    CourseObserverRole,
-    CourseStaffRole,
-)
 
-from edx_solutions_organizations.models import OrganizationUsersAttributes
+from edx_solutions_organizations.caching import attribute_schema_cache, course_overview_cache, metrics_cache
+from edx_solutions_organizations.models import (
+    OrganizationAttributeConflict,
+    OrganizationCourse,
+    OrganizationUsersAttributes,
+)
 from edx_solutions_organizations.serializers import OrganizationAttributesSerializer
-from edx_solutions_organizations.utils import generate_key_for_field, is_key_exists, is_label_exists, \
-    generate_random_key_for_field
+from edx_solutions_organizations.utils import (
+    COURSE_ADMIN_ROLES,
+    SubqueryCount,
+    chunks,
+    get_aggregate_exclusion_users,
+    queryset_chunks,
+)
 from .serializers import OrganizationSerializer, BasicOrganizationSerializer, OrganizationWithCourseCountSerializer
 from .models import Organization, OrganizationGroupUser
 
@@ -59,6 +66,7 @@ class OrganizationsViewSet(SecurePaginatedModelViewSet):
         queryset = self.get_queryset()
 
         exclude_type = request.query_params.get('type', None)
+        rollup_enabled = getattr(settings, 'ORGANIZATION_COURSES_ROLLUP_ENABLED', False)
         ids = request.query_params.get('ids', None)
         if ids:
             ids = [int(id) for id in ids.split(',')]
@@ -69,47 +77,48 @@ class OrganizationsViewSet(SecurePaginatedModelViewSet):
             queryset = queryset.filter(display_name=display_name)
 
         if exclude_type:
-            q_object = Q()
-
-            # Filtering roles to exclude
-            roles_to_exclude = [CourseInstructorRole.ROLE, CourseStaffRole.ROLE, CourseObserverRole.ROLE, CourseAssistantRole.ROLE]
-            user_ids = CourseAccessRole.objects.filter(role__in=roles_to_exclude).distinct().values_list('user_id', flat=True)
-            q_object.add(~Q(users__courseenrollment__user_id__in=user_ids), Q.AND)
-
-            # Filtering company admin users to exclude
-            admin_users = User.objects.filter(id__in=list(queryset.filter(
-                Q(users__groups__groupprofile__name=exclude_type)
-            ).distinct().values_list('users', flat=True)))
-
-            admin_users_dict = {}
-            for user in admin_users:
-                other_companies = list(user.organizations.all())[1:]
-                for company in other_companies:
-                    admin_users_dict.setdefault(company.id, []).append(user.id)
-
-            # list of users with corresponding organizations to exclude
-            exclude_admin_users = [
-                Q(id=org_id) & Q(users__courseenrollment__user_id__in=users) for
-                org_id, users in admin_users_dict.items()]
-            if exclude_admin_users:
-                exclude_admin_users = reduce(lambda a, b: a | b, exclude_admin_users)
-                q_object.add(~Q(exclude_admin_users), Q.AND)
+            # company admins are counted in their first organization only, so their
+            # enrollments are left out of every organization with a greater id
+            admin_in_earlier_organization = Organization.users.through.objects.filter(
+                user=OuterRef('user_id'),
+                organization__lt=OuterRef(OuterRef('pk')),
+                user__groups__groupprofile__name=exclude_type,
+            )
+            # users with a course role in any course are left out as well
+            enrollments = CourseEnrollment.objects.filter(user__organizations=OuterRef('pk'))\
+                .exclude(user_id__in=CourseAccessRole.objects.filter(role__in=COURSE_ADMIN_ROLES).values('user_id'))\
+                .annotate(is_excluded_admin=Exists(admin_in_earlier_organization))\
+                .filter(is_excluded_admin=False)
 
             # annotating queryset to get number of courses
             queryset = queryset.annotate(
-                number_of_courses=Count(
-                    Case(
-                        When(q_object, then=F('users__courseenrollment__course_id'))
-                    ), distinct=True
+                number_of_courses=Subquery(
+                    enrollments.order_by().annotate(total=SubqueryCount('course_id')).values('total'),
+                    output_field=IntegerField()
                 )
             )
+        elif rollup_enabled:
+            # read from the maintained rollup row of the organization
+            queryset = queryset.annotate(number_of_courses=Coalesce('stats__course_count', Value(0)))
         else:
             queryset = queryset.annotate(
-                number_of_courses=Count('users__courseenrollment__course_id', distinct=True)
+                number_of_courses=Subquery(
+                    CourseEnrollment.objects.filter(user__organizations=OuterRef('pk')).order_by()
+                    .annotate(total=SubqueryCount('course_id')).values('total'),
+                    output_field=IntegerField()
+                )
+            )
+        if rollup_enabled:
+            self.queryset = queryset.annotate(number_of_participants=Coalesce('stats__member_count', Value(0)))
+        else:
+            # counts are independent correlated subqueries, so members are not joined to their enrollments
+            self.queryset = queryset.annotate(
+                number_of_participants=Subquery(
+                    Organization.users.through.objects.filter(organization=OuterRef('pk')).order_by()
+                    .annotate(total=SubqueryCount('user')).values('total'),
+                    output_field=IntegerField()
+                )
             )
-        self.queryset = queryset.annotate(
-            number_of_participants=Count('users', distinct=True)
-        )
 
         return super(OrganizationsViewSet, self).list(request, *args, **kwargs)
 
@@ -120,53 +129,130 @@ class OrganizationsViewSet(SecurePaginatedModelViewSet):
     @detail_route(methods=['get', ])
     def metrics(self, request, pk):
         """
-        Provide statistical information for the specified Organization
+        Provide statistical information for the specified Organization. Metrics are
+        cached per organization and course filter until grades, enrollments, course
+        roles or members of the organization change
         """
-        response_data = {}
-        grade_avg = 0
-        grade_complete_match_range = getattr(settings, 'GRADEBOOK_GRADE_COMPLETE_PROFORMA_MATCH_RANGE', 0.01)
-        org_user_grades = StudentGradebook.objects.filter(user__organizations=pk, user__is_active=True)
         courses_filter = request.query_params.get('courses', None)
         courses = []
-        exclude_users = set()
         if courses_filter:
             upper_bound = getattr(settings, 'API_LOOKUP_UPPER_BOUND', 100)
             courses_filter = courses_filter.split(",")[:upper_bound]
             for course_string in courses_filter:
                 courses.append(get_course_key(course_string))
 
-            # fill exclude users
-            for course_key in courses:
-                exclude_users.union(get_aggregate_exclusion_user_ids(course_key))
+        # the key is looked up once, a result computed before an invalidation lands under the dropped generation
+        cache_key = metrics_cache.get_key(pk, courses)
+        response_data = metrics_cache.get(cache_key)
+        if response_data is None:
+            response_data = self._get_metrics(pk, courses)
+            metrics_cache.set(cache_key, response_data)
+        return Response(response_data, status=status.HTTP_200_OK)
+
+    @staticmethod
+    def _get_metrics(pk, courses):
+        """
+        Aggregates grades of organization users, over the given courses if any
+        """
+        if len(courses) == 1 and getattr(settings, 'ORGANIZATION_COURSES_ROLLUP_ENABLED', False):
+            # the rollup row of a single course holds its learner count, grade sum and completions
+            organization_course = OrganizationCourse.objects.filter(organization=pk, course_id=courses[0]).first()
+            if organization_course is None:
+                return {'users_grade_average': 0, 'users_grade_complete_count': 0}
+            grade_avg = 0
+            if organization_course.grade_sum and organization_course.learner_count:
+                grade_avg = float('{0:.3f}'.format(organization_course.grade_average))
+            return {
+                'users_grade_average': grade_avg,
+                'users_grade_complete_count': organization_course.completed_count,
+            }
+
+        response_data = {}
+        grade_avg = 0
+        grade_complete_match_range = getattr(settings, 'GRADEBOOK_GRADE_COMPLETE_PROFORMA_MATCH_RANGE', 0.01)
+        org_user_grades = StudentGradebook.objects.filter(user__organizations=pk, user__is_active=True)
+        exclude_users = []
+        if courses:
+            # users excluded from aggregates of any requested course, applied as a subquery
+            exclude_users = get_aggregate_exclusion_users(courses)
 
             org_user_grades = org_user_grades.filter(course_id__in=courses).exclude(user_id__in=exclude_users)
 
-        users_grade_sum = org_user_grades.aggregate(Sum('grade'))
-        if users_grade_sum['grade__sum']:
+        # grade sum and complete count are read with a single conditional aggregate
+        grades = org_user_grades.aggregate(
+            grade_sum=Sum('grade'),
+            complete_count=Count(
+                Case(When(proforma_grade__lte=F('grade') + grade_complete_match_range, proforma_grade__gt=0,
+                          then=F('user'))),
+                distinct=True
+            )
+        )
+        if grades['grade_sum']:
             users_enrolled_qs = CourseEnrollment.objects.filter(user__is_active=True, is_active=True,
                                                                 user__organizations=pk)\
                 .exclude(user_id__in=exclude_users)
             if courses:
                 users_enrolled_qs = users_enrolled_qs.filter(course_id__in=courses)
-            users_enrolled = users_enrolled_qs.aggregate(Count('user', distinct=True))
-            total_users = users_enrolled['user__count']
+            enrollments = users_enrolled_qs.aggregate(
+                total_users=Count('user', distinct=True),
+                total_courses=Count('course_id', distinct=True)
+            )
+            total_users = enrollments['total_users']
             if total_users:
                 # in order to compute avg across organization we need course of courses org has
-                total_courses_in_org = len(courses)
-                if not courses:
-                    org_courses = users_enrolled_qs.aggregate(Count('course_id', distinct=True))
-                    total_courses_in_org = org_courses['course_id__count']
+                total_courses_in_org = len(courses) or enrollments['total_courses']
                 grade_avg = float('{0:.3f}'.format(
-                    float(users_grade_sum['grade__sum']) / total_users / total_courses_in_org
+                    float(grades['grade_sum']) / total_users / total_courses_in_org
                 ))
         response_data['users_grade_average'] = grade_avg
+        response_data['users_grade_complete_count'] = grades['complete_count'] or 0
+        return response_data
 
-        users_grade_complete_count = org_user_grades\
-            .filter(proforma_grade__lte=F('grade') + grade_complete_match_range, proforma_grade__gt=0)\
-            .aggregate(Count('user', distinct=True))
-        response_data['users_grade_complete_count'] = users_grade_complete_count['user__count'] or 0
+    @staticmethod
+    def _serialize_users(users, counted_users, include_course_counts=False, include_grades=False,
+                         include_attributes=False):
+        """
+        Serializes a list of organization users and enriches them with the requested
+        course counts, grades and attribute values
+        """
+        grade_complete_match_range = getattr(settings, 'GRADEBOOK_GRADE_COMPLETE_PROFORMA_MATCH_RANGE', 0.01)
+        if include_course_counts:
+            # counted with one grouped query, only for the users being serialized
+            enrollments_by_user = dict(
+                CourseEnrollment.objects.filter(user_id__in=counted_users)
+                .order_by().values_list('user_id').annotate(total=Count('id'))
+            )
 
-        return Response(response_data, status=status.HTTP_200_OK)
+        # users are serialized by a single serializer and enriched in the same pass
+        response_data = SimpleUserSerializer(users, many=True).data
+        for user, user_data in zip(users, response_data):
+            if include_course_counts:
+                user_data['course_count'] = enrollments_by_user.get(user.id, 0)
+
+            if include_grades:
+                user_grades = {'grade': 0, 'proforma_grade': 0, 'complete_status': False}
+                gradebook = user.studentgradebook_set.all()
+                if gradebook:
+                    user_grades['grade'] = gradebook[0].grade
+                    user_grades['proforma_grade'] = gradebook[0].proforma_grade
+                    user_grades['complete_status'] = True if 0 < gradebook[0].proforma_grade <= \
+                        gradebook[0].grade + grade_complete_match_range else False
+                user_data.update(user_grades)
+
+            if include_attributes:
+                user_data['organization_attributes'] = {
+                    attribute.key: attribute.value for attribute in user.organization_attributes
+                }
+        return response_data
+
+    def _stream_users_json(self, users, **options):
+        """
+        Yields one JSON document per organization user
+        """
+        chunk_size = getattr(settings, 'ORGANIZATION_USERS_EXPORT_CHUNK_SIZE', 500)
+        for chunk in queryset_chunks(users, chunk_size):
+            for user_data in self._serialize_users(chunk, [user.id for user in chunk], **options):
+                yield json.dumps(user_data, cls=JSONEncoder) + '\n'
 
     @detail_route(methods=['get', 'post', 'delete'])
     def users(self, request, pk):
@@ -177,20 +263,43 @@ class OrganizationsViewSet(SecurePaginatedModelViewSet):
             * include_course_counts parameter should be `true` to get user's enrollment count
             * include_grades parameter should be `true` to get user's grades
             * for the course given in the course_id parameter
+            * include_attributes parameter should be `true` to get user's values
+            * of the organization's active attributes
             * view parameter can be used to get a particular data .i.e. view=ids to
             * get list of user ids
-        - POST: Adds a User to an Organization
+            * page_size parameter returns users a page at a time, ordered by id, as
+            * `{"next": <url of next page or null>, "results": [...]}`. The cursor
+            * parameter of the `next` url holds the id of the last user returned
+            * stream parameter should be `true` to get all users as newline delimited
+            * JSON, fetched and enriched in chunks of ORGANIZATION_USERS_EXPORT_CHUNK_SIZE
+        - POST: Adds the user given in the `id` param, or the users given in the
+            * `users` param as a list or a comma separated string of ids, to an Organization.
+            * Responds with the `added`, `already_present` and `unknown` user ids
         - DELETE: Removes the user(s) given in the `users` param from an Organization.
         """
         if request.method == 'GET':
-            include_course_counts = request.query_params.get('include_course_counts', None)
-            include_grades = request.query_params.get('include_grades', None)
+            include_course_counts = str2bool(request.query_params.get('include_course_counts', None))
+            include_attributes = str2bool(request.query_params.get('include_attributes', None))
             course_id = request.query_params.get('course_id', None)
             view = request.query_params.get('view', None)
-            grade_complete_match_range = getattr(settings, 'GRADEBOOK_GRADE_COMPLETE_PROFORMA_MATCH_RANGE', 0.01)
             course_key = None
             if course_id:
                 course_key = get_course_key(course_id)
+            include_grades = bool(course_key) and str2bool(request.query_params.get('include_grades', None))
+            page_size = request.query_params.get('page_size', None)
+            cursor = request.query_params.get('cursor', None)
+            if page_size:
+                try:
+                    page_size = min(int(page_size), getattr(settings, 'ORGANIZATION_USERS_MAX_PAGE_SIZE', 1000))
+                    cursor = int(cursor) if cursor else None
+                except ValueError:
+                    return Response({
+                        "detail": _('page_size and cursor parameters must be integers.')
+                    }, status.HTTP_400_BAD_REQUEST)
+                if page_size < 1:
+                    return Response({
+                        "detail": _('page_size parameter must be a positive integer.')
+                    }, status.HTTP_400_BAD_REQUEST)
 
             users = User.objects.filter(organizations=pk)
 
@@ -198,42 +307,55 @@ class OrganizationsViewSet(SecurePaginatedModelViewSet):
                 users = users.filter(courseenrollment__course_id__exact=course_key,
                                      courseenrollment__is_active=True)
 
-                if str2bool(include_grades):
+                if include_grades:
                     users = users.prefetch_related(
                         Prefetch('studentgradebook_set', queryset=StudentGradebook.objects.filter(course_id=course_key))
                     )
 
-            if str2bool(include_course_counts):
-                enrollments = CourseEnrollment.objects.filter(user__in=users).values('user').order_by().annotate(total=Count('user'))
-                enrollments_by_user = {}
-                for enrollment in enrollments:
-                    enrollments_by_user[enrollment['user']] = enrollment['total']
+            if include_attributes:
+                schema = attribute_schema_cache.get(pk)
+                users = users.prefetch_related(Prefetch(
+                    'user_attributes',
+                    queryset=OrganizationUsersAttributes.objects.filter(
+                        organization=pk, key__in=schema.active_keys if schema else []
+                    ),
+                    to_attr='organization_attributes'
+                ))
 
             # if we only need ids of users in organization return now
             if view == 'ids':
                 user_ids = users.values_list('id', flat=True)
                 return Response(user_ids)
 
-            response_data = []
-            if users:
-                for user in users:
-                    serializer = SimpleUserSerializer(user)
-                    user_data = serializer.data
-
-                    if str2bool(include_course_counts):
-                        user_data['course_count'] = enrollments_by_user.get(user.id, 0)
-
-                    if str2bool(include_grades) and course_key:
-                        user_grades = {'grade': 0, 'proforma_grade': 0, 'complete_status': False}
-                        gradebook = user.studentgradebook_set.all()
-                        if gradebook:
-                            user_grades['grade'] = gradebook[0].grade
-                            user_grades['proforma_grade'] = gradebook[0].proforma_grade
-                            user_grades['complete_status'] = True if 0 < gradebook[0].proforma_grade <= \
-                                gradebook[0].grade + grade_complete_match_range else False
-                        user_data.update(user_grades)
-
-                    response_data.append(user_data)
+            options = {
+                'include_course_counts': include_course_counts,
+                'include_grades': include_grades,
+                'include_attributes': include_attributes,
+            }
+            if str2bool(request.query_params.get('stream', None)):
+                # newline delimited JSON, users are fetched and enriched chunk by chunk
+                return StreamingHttpResponse(
+                    self._stream_users_json(users, **options), content_type='application/x-ndjson'
+                )
+
+            next_url = None
+            if page_size:
+                # keyset pagination, prefetches and counts only cover the users of the page
+                users = users.order_by('id')
+                if cursor:
+                    users = users.filter(id__gt=cursor)
+                users = list(users[:page_size + 1])
+                if len(users) > page_size:
+                    users = users[:page_size]
+                    next_url = replace_query_param(request.build_absolute_uri(), 'cursor', users[-1].id)
+                counted_users = [user.id for user in users]
+            else:
+                counted_users = users.values('id')
+                users = list(users)
+
+            response_data = self._serialize_users(users, counted_users, **options)
+            if page_size:
+                return Response({'next': next_url, 'results': response_data}, status=status.HTTP_200_OK)
             return Response(response_data, status=status.HTTP_200_OK)
         elif request.method == 'DELETE':
             user_ids = request.data.get('users')
@@ -257,19 +379,53 @@ class OrganizationsViewSet(SecurePaginatedModelViewSet):
             else:
                 return Response(status=status.HTTP_204_NO_CONTENT)
         else:
-            user_id = request.data.get('id')
+            user_ids = request.data.get('users')
+            single_user = user_ids is None
             try:
-                user = User.objects.get(id=user_id)
-            except ObjectDoesNotExist:
-                message = 'User {} does not exist'.format(user_id)
+                if single_user:
+                    user_ids = [int(request.data.get('id'))]
+                elif isinstance(user_ids, six.string_types):
+                    user_ids = [int(user_id) for user_id in filter(None, user_ids.split(','))]
+                else:
+                    user_ids = [int(user_id) for user_id in user_ids]
+            except (TypeError, ValueError):
+                if single_user:
+                    message = 'User {} does not exist'.format(request.data.get('id'))
+                    return Response({"detail": message}, status.HTTP_400_BAD_REQUEST)
+                return Response({
+                    "detail": _('users parameter must be a list of integers.')
+                }, status.HTTP_400_BAD_REQUEST)
+
+            batch_size = getattr(settings, 'ORGANIZATION_USERS_BATCH_SIZE', 1000)
+            added, already_present, unknown = [], [], []
+            with transaction.atomic():
+                try:
+                    # the row is locked so concurrent additions do not insert the same members
+                    organization = Organization.objects.select_for_update().get(id=pk)
+                except Organization.DoesNotExist:
+                    return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+                for user_ids_chunk in chunks(sorted(set(user_ids)), batch_size):
+                    existing = set(User.objects.filter(id__in=user_ids_chunk).values_list('id', flat=True))
+                    members = set(
+                        Organization.users.through.objects.filter(organization=organization, user__in=existing)
+                        .values_list('user_id', flat=True)
+                    )
+                    new_members = [user_id for user_id in user_ids_chunk if user_id in existing - members]
+                    if new_members:
+                        # sends m2m_changed so that membership caches and stats are refreshed
+                        organization.users.add(*new_members)
+                    added.extend(new_members)
+                    already_present.extend(user_id for user_id in user_ids_chunk if user_id in members)
+                    unknown.extend(user_id for user_id in user_ids_chunk if user_id not in existing)
+
+            if single_user and unknown:
+                message = 'User {} does not exist'.format(request.data.get('id'))
                 return Response({"detail": message}, status.HTTP_400_BAD_REQUEST)
-            try:
-                organization = Organization.objects.select_for_update().get(id=pk)
-            except Organization.DoesNotExist:
-                return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
-            organization.users.add(user)
-            organization.save()
-            return Response({}, status=status.HTTP_201_CREATED)
+            return Response({
+                'added': added,
+                'already_present': already_present,
+                'unknown': unknown,
+            }, status=status.HTTP_201_CREATED)
 
     @detail_route(methods=['get', 'post'])
     def groups(self, request, pk):
@@ -315,45 +471,59 @@ class OrganizationsViewSet(SecurePaginatedModelViewSet):
     def courses(self, request, pk):  # pylint: disable=W0613
         """
         Returns list of courses in an organization
+        - count_enrolled_users parameter should be `true` to get `enrolled_users_count`
+        - of each course instead of the `enrolled_users` list of user ids
         """
         exclude_admins = str2bool(request.query_params.get('exclude_admins'))
+        count_enrolled_users = str2bool(request.query_params.get('count_enrolled_users'))
         organization = self.get_object()
-        organization_courses = []
-        organization_course_ids = []
-        roles_to_exclude = []
+        enrollment_qs = CourseEnrollment.objects.filter(user__organizations=organization, is_active=True)
         if exclude_admins:
-            organization_courses = CourseEnrollment.objects\
-                .filter(user__organizations=organization, is_active=True)\
-                .order_by('course_id').distinct().values_list('course_id', flat=True)
-            for course_id in organization_courses:
-                organization_course_ids.append(course_id.to_deprecated_string())
-            organization_courses = map(get_course_key, filter(None, organization_course_ids))
-            roles_to_exclude = [CourseInstructorRole.ROLE, CourseStaffRole.ROLE, CourseObserverRole.ROLE, CourseAssistantRole.ROLE]
-
-        enrollment_qs = CourseEnrollment.objects\
-            .filter(user__organizations=organization, is_active=True)\
-            .exclude(
-                user_id__in=CourseAccessRole.objects.filter(
-                    course_id__in=organization_courses, role__in=roles_to_exclude
-                ).values_list('user_id', flat=True)
-            ).values_list('course_id', 'user_id')
-
-        enrollments = {}
-        course_ids = []
-        for (course_id, user_id) in enrollment_qs:
-            enrollments.setdefault(course_id.to_deprecated_string(), []).append(user_id)
-            if course_id.to_deprecated_string() not in course_ids:
-                course_ids.append(course_id.to_deprecated_string())
-
-        course_keys = map(get_course_key, filter(None, course_ids))
+            # enrollments of users holding an admin role in the same course are left out
+            enrollment_qs = enrollment_qs.annotate(
+                is_course_admin=Exists(CourseAccessRole.objects.filter(
+                    user_id=OuterRef('user_id'), course_id=OuterRef('course_id'), role__in=COURSE_ADMIN_ROLES
+                ))
+            ).filter(is_course_admin=False)
+
+        if count_enrolled_users and getattr(settings, 'ORGANIZATION_COURSES_ROLLUP_ENABLED', False):
+            # counts are read from the maintained rollup rows of the organization
+            count_field = 'participant_count' if exclude_admins else 'enrolled_count'
+            enrollment_counts = dict(
+                OrganizationCourse.objects.filter(organization=organization, **{count_field + '__gt': 0})
+                .values_list('course_id', count_field)
+            )
+            course_keys = list(enrollment_counts)
+            enrollments = {course_key.to_deprecated_string(): [] for course_key in course_keys}
+        elif count_enrolled_users:
+            # only per course counts are read, user ids are not transferred
+            enrollment_counts = dict(enrollment_qs.order_by().values_list('course_id').annotate(total=Count('id')))
+            course_keys = list(enrollment_counts)
+            enrollments = {course_key.to_deprecated_string(): [] for course_key in course_keys}
+        else:
+            # grouped in one pass by course key, each key is converted to a string once
+            enrollments_by_course = {}
+            for (course_key, user_id) in enrollment_qs.values_list('course_id', 'user_id'):
+                enrollments_by_course.setdefault(course_key, []).append(user_id)
+            enrollments = {
+                course_key.to_deprecated_string(): user_ids for course_key, user_ids in enrollments_by_course.items()
+            }
+            course_keys = list(enrollments_by_course)
+
+        # overviews are served from the process cache and ordered by course id
+        overviews = course_overview_cache.get_many(course_keys)
+        courses = sorted(overviews.values(), key=lambda course: six.text_type(course.id))
         if request.query_params.get('mobile_available'):
             mobile_available = str2bool(request.query_params.get('mobile_available'))
-            courses = CourseOverview.objects.filter(id__in=course_keys, mobile_available=mobile_available)
-        else:
-            courses = CourseOverview.objects.filter(id__in=course_keys)
+            courses = [course for course in courses if course.mobile_available == mobile_available]
 
         serializer = OrganizationCourseSerializer(courses, many=True, context={'request': request, 'enrollments': enrollments})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        response_data = serializer.data
+        if count_enrolled_users:
+            for course, course_data in zip(courses, response_data):
+                course_data.pop('enrolled_users', None)
+                course_data['enrolled_users_count'] = enrollment_counts.get(course.id, 0)
+        return Response(response_data, status=status.HTTP_200_OK)
 
 
 class OrganizationsGroupsUsersList(SecureListAPIView):
@@ -504,26 +674,32 @@ class OrganizationAttributesView(MobileAPIView):
         **POST**
 
         If the request is successful, the request returns an HTTP 201 "CREATED" response.
+
+        **POST/PUT/DELETE**
+
+        If the change conflicts with an existing or concurrently changed attribute,
+        the request returns an HTTP 409 "CONFLICT" response.
     """
 
     def get(self, request, organization_id):
         """
         GET /api/organizations/{organization_id}/attributes
         """
-        try:
-            organization = Organization.objects.get(id=organization_id)
-        except ObjectDoesNotExist:
+        schema = attribute_schema_cache.get(organization_id)
+        if schema is None:
             return Response({
                 "detail": 'Organization with {}, does not exists.'.format(organization_id)
             }, status.HTTP_404_NOT_FOUND)
 
-        return Response(organization.get_all_attributes(), status.HTTP_200_OK)
+        return Response(schema.get_active_attributes(), status.HTTP_200_OK)
 
     def post(self, request, organization_id):
         """
         POST /api/organizations/{organization_id}/attributes
         """
         name = request.data.get('name')
+        if not (name and isinstance(name, six.string_types)):
+            return Response({"detail": 'name parameter is missing.'}, status.HTTP_400_BAD_REQUEST)
 
         try:
             organization = Organization.objects.get(id=organization_id)
@@ -532,16 +708,16 @@ class OrganizationAttributesView(MobileAPIView):
                 "detail": 'Organization with {}, does not exists.'.format(organization_id)
             }, status.HTTP_404_NOT_FOUND)
 
-        attributes = json.loads(organization.attributes)
         if organization.is_attribute_exists(name):
             return Response({
                 "detail": 'Name {} already exists.'.format(name)
             }, status.HTTP_409_CONFLICT)
-        order = generate_key_for_field(attributes)
-        key = generate_random_key_for_field(name, order)
-        attributes[key] = {'label': name, 'order': order, 'is_active': True}
-        organization.attributes = json.dumps(attributes)
-        organization.save()
+        try:
+            organization.add_attribute(name)
+        except ValidationError as exc:
+            return Response({"detail": exc.messages[0]}, status.HTTP_400_BAD_REQUEST)
+        except OrganizationAttributeConflict as exc:
+            return Response({"detail": force_text(exc)}, status.HTTP_409_CONFLICT)
 
         return Response({}, status=status.HTTP_201_CREATED)
 
@@ -551,6 +727,8 @@ class OrganizationAttributesView(MobileAPIView):
         """
         key = request.data.get('key')
         name = request.data.get('name')
+        if not (name and isinstance(name, six.string_types)):
+            return Response({"detail": 'name parameter is missing.'}, status.HTTP_400_BAD_REQUEST)
 
         try:
             organization = Organization.objects.get(id=organization_id)
@@ -559,21 +737,23 @@ class OrganizationAttributesView(MobileAPIView):
                 "detail": 'Organization with {}, does not exists.'.format(organization_id)
             }, status.HTTP_404_NOT_FOUND)
 
-        attributes = json.loads(organization.attributes)
-
-        if not organization.is_key_exists(key):
+        schema = organization.attribute_schema
+        if key not in schema.active_keys:
             return Response({
                 "detail": 'Key {} does not exists.'.format(key)
             }, status.HTTP_404_NOT_FOUND)
 
-        if is_label_exists(name, attributes):
+        if name in schema.labels:
             return Response({
                 "detail": 'Name {} already exists.'.format(name)
             }, status.HTTP_409_CONFLICT)
 
-        attributes[key]['label'] = name
-        organization.attributes = json.dumps(attributes)
-        organization.save()
+        try:
+            organization.rename_attribute(key, name)
+        except ValidationError as exc:
+            return Response({"detail": exc.messages[0]}, status.HTTP_400_BAD_REQUEST)
+        except OrganizationAttributeConflict as exc:
+            return Response({"detail": force_text(exc)}, status.HTTP_409_CONFLICT)
 
         return Response({}, status=status.HTTP_200_OK)
 
@@ -590,15 +770,247 @@ class OrganizationAttributesView(MobileAPIView):
                 "detail": 'Organization with {}, does not exists.'.format(organization_id)
             }, status.HTTP_404_NOT_FOUND)
 
-        attributes = json.loads(organization.attributes)
-
         if not organization.is_key_exists(key):
             return Response({
                 "detail": 'Key {} does not exists.'.format(key)
             }, status.HTTP_404_NOT_FOUND)
 
-        attributes[key]['is_active'] = False
-        organization.attributes = json.dumps(attributes)
-        organization.save()
+        try:
+            organization.deactivate_attribute(key)
+        except OrganizationAttributeConflict as exc:
+            return Response({"detail": force_text(exc)}, status.HTTP_409_CONFLICT)
 
         return Response({}, status=status.HTTP_200_OK)
+
+
+class OrganizationAttributesBatchView(MobileAPIView):
+    """
+    **Use Case**
+
+        Create, rename and deactivate several attributes of an organization in one request.
+
+    **Example Requests**
+
+        POST /api/organizations/{organization_id}/attributes/batch
+
+        **POST Parameters**
+
+        * operations: list of operations, applied in the given order
+
+        "operations": [
+            {"action": "create", "name": "Phone"},
+            {"action": "rename", "key": "phone_1", "name": "Cell"},
+            {"action": "deactivate", "key": "address_2"}
+        ]
+
+    **Response Values**
+
+        * results: status, key and label or error detail of each operation
+
+        If all operations are valid they are applied together and the request
+        returns an HTTP 200 "OK" response. Otherwise nothing is applied and the
+        request returns an HTTP 400 "BAD REQUEST" response.
+    """
+
+    def post(self, request, organization_id):
+        """
+        POST /api/organizations/{organization_id}/attributes/batch
+        """
+        operations = request.data.get('operations')
+        max_operations = getattr(settings, 'ORGANIZATION_ATTRIBUTES_BATCH_LIMIT', 100)
+        if not isinstance(operations, list) or not operations:
+            return Response({
+                "detail": _('operations parameter must be a non empty list.')
+            }, status.HTTP_400_BAD_REQUEST)
+        if len(operations) > max_operations:
+            return Response({
+                "detail": _('operations parameter must not contain more than {limit} items.').format(
+                    limit=max_operations
+                )
+            }, status.HTTP_400_BAD_REQUEST)
+
+        try:
+            organization = Organization.objects.get(id=organization_id)
+        except ObjectDoesNotExist:
+            return Response({
+                "detail": 'Organization with {}, does not exists.'.format(organization_id)
+            }, status.HTTP_404_NOT_FOUND)
+
+        try:
+            results, applied = organization.apply_attribute_operations(operations)
+        except IntegrityError:
+            return Response({
+                "detail": _('Attributes were changed by another request.')
+            }, status.HTTP_409_CONFLICT)
+
+        return Response(
+            {'results': results},
+            status=status.HTTP_200_OK if applied else status.HTTP_400_BAD_REQUEST
+        )
+
+
+class OrganizationUsersAttributesView(SecureAPIView):
+    """
+    **Use Case**
+
+        Bulk create or update attribute values of organization users.
+
+    **Example Requests**
+
+        POST /api/organizations/{organization_id}/users/attributes
+
+        **POST Parameters**
+
+        * attributes: list of user attribute values
+
+        "attributes": [
+            {"user_id": 1, "key": "phone_1", "value": "+1 332 232 24234"},
+            {"user_id": 2, "key": "phone_1", "value": "+1 332 232 24235"}
+        ]
+
+    **Response Values**
+
+        If all values are valid, the request returns an HTTP 200 "OK" response
+        with the number of `created` and `updated` values. Otherwise nothing is
+        written and the request returns an HTTP 400 "BAD REQUEST" response.
+    """
+
+    def post(self, request, organization_id):
+        """
+        POST /api/organizations/{organization_id}/users/attributes
+        """
+        attributes = request.data.get('attributes')
+        if not isinstance(attributes, list) or not attributes:
+            return Response({
+                "detail": _('attributes parameter must be a non empty list.')
+            }, status.HTTP_400_BAD_REQUEST)
+
+        try:
+            organization = Organization.objects.get(id=organization_id)
+        except ObjectDoesNotExist:
+            return Response({
+                "detail": 'Organization with {}, does not exists.'.format(organization_id)
+            }, status.HTTP_404_NOT_FOUND)
+
+        try:
+            rows = [(attribute['user_id'], attribute['key'], attribute['value']) for attribute in attributes]
+        except (KeyError, TypeError):
+            return Response({
+                "detail": _('each attribute must have user_id, key and value.')
+            }, status.HTTP_400_BAD_REQUEST)
+
+        try:
+            created, updated = OrganizationUsersAttributes.bulk_upsert(organization, rows)
+        except ValidationError as exc:
+            return Response({"detail": exc.messages}, status.HTTP_400_BAD_REQUEST)
+        except IntegrityError:
+            # a concurrent request inserted a value for the same user and key, nothing was written
+            return Response({
+                "detail": _('attribute values were changed by a concurrent request, please retry.')
+            }, status.HTTP_409_CONFLICT)
+
+        return Response({'created': created, 'updated': updated}, status=status.HTTP_200_OK)
+
+
+class _Echo(object):
+    """
+    File-like object which returns what is written to it, used to stream csv rows
+    """
+    def write(self, value):  # pylint: disable=no-self-use
+        return value
+
+
+class OrganizationUsersExportView(SecureAPIView):
+    """
+    **Use Case**
+
+        Export organization users along with their course grades and attribute
+        values as a CSV file.
+
+    **Example Requests**
+
+        GET /api/organizations/{organization_id}/users/export
+
+        GET /api/organizations/{organization_id}/users/export?course_id={course_id_1},{course_id_2}
+
+    **Response Values**
+
+        A streamed CSV file with one row per organization user. Columns are the
+        user id, username, email, first name and last name, then the grade,
+        proforma grade and complete status for each course, then a column per
+        active organization attribute. If course_id is not given, every course
+        organization users are enrolled in is exported. Grade columns are empty
+        for users without a grade in the course.
+    """
+
+    user_fields = ('id', 'username', 'email', 'first_name', 'last_name')
+
+    def get(self, request, organization_id):
+        """
+        GET /api/organizations/{organization_id}/users/export
+        """
+        schema = attribute_schema_cache.get(organization_id)
+        if schema is None:
+            return Response({
+                "detail": 'Organization with {}, does not exists.'.format(organization_id)
+            }, status.HTTP_404_NOT_FOUND)
+
+        course_ids = request.query_params.get('course_id', None)
+        if course_ids:
+            course_keys = [get_course_key(course_id) for course_id in filter(None, course_ids.split(','))]
+            if not all(course_keys):
+                return Response({"detail": _('course_id parameter is not valid.')}, status.HTTP_400_BAD_REQUEST)
+        else:
+            course_keys = list(
+                CourseEnrollment.objects.filter(user__organizations=organization_id, is_active=True)
+                .order_by('course_id').values_list('course_id', flat=True).distinct()
+            )
+
+        users = User.objects.filter(organizations=organization_id)
+        writer = csv.writer(_Echo())
+        response = StreamingHttpResponse(
+            (writer.writerow(row) for row in self._get_rows(
+                organization_id, users, course_keys, schema.get_active_attributes()
+            )),
+            content_type='text/csv'
+        )
+        response['Content-Disposition'] = 'attachment; filename="organization_{}_users.csv"'.format(organization_id)
+        return response
+
+    def _get_rows(self, organization_id, users, course_keys, attributes):
+        """
+        Yields the header and then one row per user. Each chunk of users is read
+        with one query for users, one for grades and one for attribute values.
+        """
+        grade_complete_match_range = getattr(settings, 'GRADEBOOK_GRADE_COMPLETE_PROFORMA_MATCH_RANGE', 0.01)
+        attribute_keys = [attribute['key'] for attribute in attributes]
+
+        header = list(self.user_fields)
+        for course_key in course_keys:
+            header.extend('{} {}'.format(course_key, column) for column in ('grade', 'proforma_grade', 'complete_status'))
+        header.extend(attribute['label'] for attribute in attributes)
+        yield [smart_str(column) for column in header]
+
+        chunk_size = getattr(settings, 'ORGANIZATION_USERS_EXPORT_CHUNK_SIZE', 500)
+        for chunk in queryset_chunks(users, chunk_size):
+            user_ids = [user.id for user in chunk]
+            grades = {}
+            if course_keys:
+                gradebooks = StudentGradebook.objects.filter(user_id__in=user_ids, course_id__in=course_keys)\
+                    .values_list('user_id', 'course_id', 'grade', 'proforma_grade')
+                for user_id, course_key, grade, proforma_grade in gradebooks:
+                    grades[(user_id, course_key)] = (
+                        grade,
+                        proforma_grade,
+                        0 < proforma_grade <= grade + grade_complete_match_range,
+                    )
+            attribute_values = OrganizationUsersAttributes.get_values(
+                user_ids, attribute_keys, default='', organization=organization_id
+            )
+
+            for user in chunk:
+                row = [getattr(user, field) for field in self.user_fields]
+                for course_key in course_keys:
+                    row.extend(grades.get((user.id, course_key), ('', '', '')))
+                row.extend(attribute_values[user.id][key] for key in attribute_keys)
+                yield [smart_str(value) for value in row]